@@ -1,4 +1,6 @@
 import shlex
+import sys
+import argparse
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
@@ -12,7 +14,22 @@ import time
 from pathlib import Path
 from datetime import datetime
 import signal
+import socket
+import hmac
+import secrets
 import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import urllib.request
+import urllib.error
+
+# 编码器进度行: x265 (已知/未知总帧数), vspipe -p, ffmpeg
+X265_PROGRESS_RE = re.compile(r"\[[\d.]+%\]\s+(\d+)/(\d+) frames, ([\d.]+) fps, ([\d.]+) kb/s(?:, eta (\d+):(\d+):(\d+))?")
+X265_FRAMES_RE = re.compile(r"^(\d+) frames: ([\d.]+) fps, ([\d.]+) kb/s")
+VSPIPE_PROGRESS_RE = re.compile(r"Frame: (\d+)/(\d+)(?: \(([\d.]+) fps\))?")
+FFMPEG_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+FFMPEG_PROGRESS_RE = re.compile(r"time=(\d+):(\d+):([\d.]+).*?bitrate=\s*([\d.]+|N/A)(?:kbits/s)?.*?speed=\s*([\d.]+)x")
 
 class EncodingTask:
     def __init__(self, episode_num, task_type, command, prerequisites=None, work_dir=None):
@@ -28,6 +45,77 @@ class EncodingTask:
         self.custom_params = {}
         self.paused = False
         self.work_dir = work_dir
+        self.reset_progress()
+        self.reset_trace()
+
+    def reset_trace(self):
+        # 性能记录: 就绪时间; 资源占用和读写量由执行句柄 (self.process) 收集
+        self.ready_time = None
+
+    def reset_progress(self):
+        # 进度: x265/vspipe以帧为单位, ffmpeg以秒为单位
+        self.frames_done = None
+        self.total_frames = None
+        self.fps = None
+        self.bitrate = None
+        self.speed = None
+        self.eta = None
+
+    def parse_progress(self, line):
+        """从编码器输出行中解析进度, 是进度行时返回True"""
+        match = X265_PROGRESS_RE.search(line)
+        if match:
+            self.frames_done, self.total_frames = int(match.group(1)), int(match.group(2))
+            self.fps, self.bitrate = float(match.group(3)), float(match.group(4))
+            if match.group(5):
+                h, m, sec = (int(x) for x in match.group(5, 6, 7))
+                self.eta = h * 3600 + m * 60 + sec
+            else:
+                self._estimate_eta(self.fps)
+            return True
+
+        match = X265_FRAMES_RE.search(line)
+        if match:
+            self.frames_done = int(match.group(1))
+            self.fps, self.bitrate = float(match.group(2)), float(match.group(3))
+            self._estimate_eta(self.fps)
+            return True
+
+        match = VSPIPE_PROGRESS_RE.search(line)
+        if match:
+            # vspipe输出给x265的帧数略领先于x265, 只用来提供总帧数
+            self.total_frames = int(match.group(2))
+            if self.frames_done is None:
+                self.frames_done = int(match.group(1))
+                if match.group(3):
+                    self.fps = float(match.group(3))
+            self._estimate_eta(self.fps)
+            return True
+
+        match = FFMPEG_PROGRESS_RE.search(line)
+        if match:
+            h, m, sec = int(match.group(1)), int(match.group(2)), float(match.group(3))
+            self.frames_done = h * 3600 + m * 60 + sec
+            self.bitrate = None if match.group(4) == "N/A" else float(match.group(4))
+            self.speed = float(match.group(5))
+            self._estimate_eta(self.speed)
+            return True
+
+        match = FFMPEG_DURATION_RE.search(line)
+        if match and self.total_frames is None:
+            h, m, sec = int(match.group(1)), int(match.group(2)), float(match.group(3))
+            self.total_frames = h * 3600 + m * 60 + sec
+        return False
+
+    def _estimate_eta(self, rate):
+        if self.total_frames and self.frames_done is not None and rate:
+            self.eta = max(0.0, (self.total_frames - self.frames_done) / rate)
+
+    @property
+    def percent(self):
+        if self.total_frames and self.frames_done is not None:
+            return min(100.0, self.frames_done * 100 / self.total_frames)
+        return None
     
     def is_completed(self, root_path):
         if self.status == "stopped":
@@ -37,11 +125,18 @@ class EncodingTask:
         result_dir = Path(root_path) / "result"
         
         try:
+            # 记录了输出文件的任务直接检查该文件 (合并封装模式下输出位于result目录)
+            if self.custom_params.get("output_mkv"):
+                return Path(self.custom_params["output_mkv"]).exists()
+
             if self.task_type == "video":
                 return (episode_dir / "video.mkv").exists()
                 
             elif self.task_type == "audio":
                 return (episode_dir / f"output{self.episode_num}.flac").exists()
+
+            elif self.task_type == "calibrate":
+                return (episode_dir / "calibration.json").exists()
                 
             elif self.task_type == "subtitle_process":
                 return (episode_dir / "subsetted_fonts").exists()
@@ -77,6 +172,8 @@ class EncodingProject:
     def __init__(self):
         self.root_path = None
         self.tasks = []
+        # (episode_num, task_type) -> task, 代替在tasks中线性查找
+        self.task_index = {}
         self.default_normal_x265_params = {
             "crf": 16,
             "tune": "lp",
@@ -90,8 +187,26 @@ class EncodingProject:
         self.current_normal_x265_params = self.default_normal_x265_params.copy()
         self.current_hardsub_x265_params = self.default_hardsub_x265_params.copy()
         self.episode_params = {}
+        # 单集视频分块并行编码的块数, 1为不分块
+        self.chunks = 1
         self.use_move_mode = False
+        # 合并封装模式: 不生成 merge/organize, mux和硬字幕封装直接从编码输出写入result目录
+        self.use_consolidated_mux = False
+        # 校准模式: 每集视频编码前先做采样试编码, 给出 (或直接应用) 该集的CRF
+        self.use_calibration = False
+        self.default_calibration = {
+            "crfs": "14,16,18,20",
+            "samples": 6,
+            "sample_frames": 240,
+            "target_kbps": "",
+            "target_ssim": "",
+            "auto_apply": False
+        }
+        self.calibration = self.default_calibration.copy()
         self.params_file = None
+        # 每个任务结束时追加一行JSON的性能记录, 由 report 子命令汇总
+        self.trace_file = None
+        self.trace_lock = threading.Lock()
         
     def setup_project(self, root_path):
         self.root_path = Path(root_path)
@@ -101,13 +216,52 @@ class EncodingProject:
         # 创建或加载编码参数配置文件
         self.params_file = self.root_path / "encoding_params.json"
         self.load_encoding_params()
+        self.trace_file = self.root_path / "encode_trace.jsonl"
+
+    def record_trace(self, task):
+        """把结束的任务的时间、CPU、内存和读写量追加到 encode_trace.jsonl"""
+        if self.trace_file is None or task.start_time is None:
+            return
+        start = task.start_time.timestamp()
+        end = (task.end_time or datetime.now()).timestamp()
+        rusage = getattr(task.process, "rusage", None) or {}
+        io = getattr(task.process, "io", None) or {}
+        record = {
+            "episode": task.episode_num,
+            "task": task.task_type,
+            "status": task.status,
+            "host": getattr(task.process, "host", None),
+            "returncode": task.process.returncode if task.process else None,
+            "prerequisites": task.prerequisites,
+            "ready": task.ready_time,
+            "start": start,
+            "end": end,
+            "queue_wait": max(0.0, start - task.ready_time) if task.ready_time else None,
+            "wall": end - start,
+            "cpu_user": rusage.get("cpu_user"),
+            "cpu_sys": rusage.get("cpu_sys"),
+            "max_rss_kb": rusage.get("max_rss_kb"),
+            "frames": task.frames_done,
+            "chunks": self.chunks if task.task_type == "video" else None,
+        }
+        # read_bytes/write_bytes为实际落盘的读写量, rchar/wchar还包括管道
+        for key in ("read_bytes", "write_bytes", "rchar", "wchar"):
+            record[key] = io.get(key)
+
+        try:
+            with self.trace_lock, open(self.trace_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Error writing trace: {str(e)}")
 
     def save_encoding_params(self):
         """保存编码参数到JSON文件"""
         params_data = {
             "global": {
                 "normal": self.current_normal_x265_params,
-                "hardsub": self.current_hardsub_x265_params
+                "hardsub": self.current_hardsub_x265_params,
+                "chunks": self.chunks,
+                "calibration": self.calibration
             },
             "episodes": self.episode_params
         }
@@ -142,6 +296,12 @@ class EncodingProject:
                     for key in self.default_hardsub_x265_params:
                         if key in loaded_hardsub:
                             self.current_hardsub_x265_params[key] = loaded_hardsub[key]
+
+                self.chunks = max(1, int(params_data["global"].get("chunks", 1)))
+                loaded_calibration = params_data["global"].get("calibration", {})
+                for key in self.default_calibration:
+                    if key in loaded_calibration:
+                        self.calibration[key] = loaded_calibration[key]
             
             # 加载单集参数
             if "episodes" in params_data:
@@ -340,41 +500,100 @@ class EncodingProject:
 
     def _generate_mux_task(self, episode_num):
         episode_dir = self.root_path / f"E{episode_num.zfill(2)}"
-        temp_dir = episode_dir / "temp"
-        fonts_dir = episode_dir / "subsetted_fonts"
 
-        # 使用命令去动态查找字幕文件
-        mux_command = (
-            f'mkdir -p "{str(temp_dir)}" && '
-            f'mkvextract "{str(episode_dir / "final_output.mkv")}" tracks '
-            f'0:"{str(temp_dir / "video.hevc")}" '
-            f'1:"{str(temp_dir / "audio.flac")}" && '
-            f'mkvmerge -o "{str(episode_dir / "final_with_subs.mkv")}" '
-            f'--language 0:und "{str(temp_dir / "video.hevc")}" '
-            f'--language 0:ja "{str(temp_dir / "audio.flac")}" '
-            f'--language 0:zh-cn --track-name 0:简日双语 '
-            f'--default-track 0:yes "$(ls "{str(episode_dir)}"/*.chs_jpn.rename.ass)" '
-            f'--language 0:zh-tw --track-name 0:繁日双语 '
-            f'--default-track 0:no "$(ls "{str(episode_dir)}"/*.cht_jpn.rename.ass)" '
-            f'--chapters "{str(list(episode_dir.glob("*.txt"))[0])}" && '
-            f'find "{str(fonts_dir)}" -type f -name "*.ttf" '
-            f'-exec mkvpropedit "{str(episode_dir / "final_with_subs.mkv")}" '
-            f'--attachment-mime-type font/ttf --add-attachment "{{}}" \\; && '
-            f'find "{str(fonts_dir)}" -type f -name "*.otf" '
-            f'-exec mkvpropedit "{str(episode_dir / "final_with_subs.mkv")}" '
-            f'--attachment-mime-type font/otf --add-attachment "{{}}" \\; && '
-            f'rm -rf "{str(temp_dir)}"'
-        )
+        if self.use_consolidated_mux:
+            # 直接从视频和flac封装到result目录
+            prerequisites = ["audio", "video", "subtitle_process"]
+            custom_params = {
+                "video_input": str(episode_dir / "video.mkv"),
+                "audio_input": str(episode_dir / f"output{episode_num}.flac"),
+                "output_mkv": str(self.root_path / "result" / f"E{episode_num.zfill(2)}_complete.mkv")
+            }
+        else:
+            prerequisites = ["merge", "subtitle_process"]  # 确保字幕处理完成后再执行
+            custom_params = {
+                "video_input": str(episode_dir / "final_output.mkv"),
+                "output_mkv": str(episode_dir / "final_with_subs.mkv")
+            }
 
         mux_task = EncodingTask(
             episode_num,
             "mux",
-            mux_command,
-            prerequisites=["merge", "subtitle_process"],  # 确保字幕处理完成后再执行
+            None,  # 字幕和字体在subtitle_process之后才存在，运行时再构造
+            prerequisites=prerequisites,
             work_dir=str(episode_dir)
         )
+        mux_task.custom_params = custom_params
 
         return [mux_task]
+
+    def generate_calibrate_command(self, episode_num, input_vpy, output_json):
+        """构造 calibrate 子命令, tune/preset 使用该集当前的普通编码参数"""
+        params = self.get_episode_params(episode_num, False)
+        command = (
+            f'{self_invocation()} calibrate '
+            f'--crfs={shlex.quote(str(self.calibration["crfs"]))} '
+            f'--tune={shlex.quote(str(params["tune"]))} --preset={shlex.quote(str(params["preset"]))} '
+            f'--samples {int(self.calibration["samples"])} --sample-frames {int(self.calibration["sample_frames"])} '
+        )
+        if str(self.calibration["target_kbps"]).strip():
+            command += f'--target-kbps {float(self.calibration["target_kbps"])} '
+        if str(self.calibration["target_ssim"]).strip():
+            command += f'--target-ssim {float(self.calibration["target_ssim"])} '
+        return command + f'--output "{output_json}" "{input_vpy}"'
+
+    def apply_calibration(self, episode_num, calibration_file):
+        """把 calibration.json 中的建议CRF写入该集的普通编码参数, 返回该CRF (没有建议时返回None)"""
+        with open(calibration_file, encoding="utf-8") as f:
+            result = json.load(f)
+        crf = result.get("suggested_crf")
+        if crf is None:
+            return None
+
+        normal_params = {key: str(value) for key, value in self.get_episode_params(episode_num, False).items()}
+        normal_params["crf"] = str(crf)
+        hardsub_params = {key: str(value) for key, value in self.get_episode_params(episode_num, True).items()}
+        self.episode_params[episode_num] = {
+            "normal": normal_params,
+            "hardsub": hardsub_params
+        }
+        self.save_encoding_params()
+        return crf
+
+    def generate_mux_command(self, episode_num, output_mkv, video_input, audio_input=None):
+        """
+        一次mkvmerge直接取视频和音频轨, 同时加入字幕、章节和所有子集化字体,
+        不再先mkvextract到temp再逐个字体mkvpropedit.
+        没有audio_input时视频和音频都取自video_input (final_output.mkv的0、1轨).
+        """
+        episode_dir = self.root_path / f"E{episode_num.zfill(2)}"
+        fonts_dir = episode_dir / "subsetted_fonts"
+        chs_ass = list(episode_dir.glob("*.chs_jpn.rename.ass"))
+        cht_ass = list(episode_dir.glob("*.cht_jpn.rename.ass"))
+        chapters = list(episode_dir.glob("*.txt"))
+        if not chs_ass or not cht_ass or not chapters:
+            raise ValueError(f"Missing subtitles or chapters in {episode_dir}")
+
+        cmd = ["mkvmerge", "-o", output_mkv]
+        if audio_input is None:
+            cmd += [
+                "--video-tracks", "0", "--audio-tracks", "1",
+                "--no-subtitles", "--no-attachments", "--no-chapters",
+                "--language", "0:und", "--language", "1:ja", video_input
+            ]
+        else:
+            cmd += ["--language", "0:und", video_input, "--language", "0:ja", audio_input]
+        cmd += [
+            "--language", "0:zh-cn", "--track-name", "0:简日双语", "--default-track", "0:yes", str(chs_ass[0]),
+            "--language", "0:zh-tw", "--track-name", "0:繁日双语", "--default-track", "0:no", str(cht_ass[0]),
+            "--chapters", str(chapters[0])
+        ]
+        mime_types = {".ttf": "font/ttf", ".otf": "font/otf"}
+        for font in sorted(fonts_dir.rglob("*")):
+            if font.is_file() and font.suffix in mime_types:
+                cmd += ["--attachment-mime-type", mime_types[font.suffix], "--attach-file", str(font)]
+        return (f'mkdir -p {shlex.quote(str(Path(output_mkv).parent))} && ' +
+                ' '.join(shlex.quote(str(x)) for x in cmd))
     
     def _execute_task(self, task):
         try:
@@ -481,22 +700,38 @@ class EncodingProject:
         )
         tasks.append(subtitle_cleanup_task)
 
-        # 音频任务
+        # 音频任务: 只解码一次源文件, 同一个ffmpeg同时输出AAC和FLAC (保持源的位深), 不落地WAV.
+        # FLAC由ffmpeg直接编码, 而不是用管道把WAV交给外部编码器: 写入管道的WAV头里没有正确的长度
         audio_task = EncodingTask(
             episode_num,
             "audio",
-            f'ffmpeg -i "{str(source_path)}" -c:a pcm_s24le "{str(episode_dir / f"audio{episode_num}.wav")}" && '
-            f'flaldf "{str(episode_dir / f"audio{episode_num}.wav")}" -o "{str(episode_dir / f"output{episode_num}.flac")}" && '
-            f'ffmpeg -i "{str(episode_dir / f"audio{episode_num}.wav")}" -c:a aac_at  -global_quality:a 14 -aac_at_mode 2 -b:a 320k "{str(episode_dir / f"audio{episode_num}.aac")}"',
+            f'ffmpeg -y -i "{str(source_path)}" '
+            f'-map 0:a:0 -c:a aac_at -global_quality:a 14 -aac_at_mode 2 -b:a 320k "{str(episode_dir / f"audio{episode_num}.aac")}" '
+            f'-map 0:a:0 -c:a flac -compression_level 12 "{str(episode_dir / f"output{episode_num}.flac")}"',
             work_dir=str(episode_dir)
         )
         tasks.append(audio_task)
 
+        # 校准任务: 采样试编码, 结果写入 calibration.json, 视频编码等它完成后再开始
+        if self.use_calibration:
+            calibrate_task = EncodingTask(
+                episode_num,
+                "calibrate",
+                None,  # 运行时按当前参数构造
+                work_dir=str(episode_dir)
+            )
+            calibrate_task.custom_params = {
+                "input_vpy": str(episode_dir / f"{episode_num.zfill(2)}.vpy"),
+                "output_json": str(episode_dir / "calibration.json")
+            }
+            tasks.append(calibrate_task)
+
         # 视频任务
         video_task = EncodingTask(
             episode_num,
             "video",
             None,  # 命令先设为None，运行时再构造
+            prerequisites=["calibrate"] if self.use_calibration else None,
             work_dir=str(episode_dir)
         )
         video_task.custom_params = {
@@ -506,15 +741,16 @@ class EncodingProject:
         }
         tasks.append(video_task)
 
-        # 合并任务
-        merge_task = EncodingTask(
-            episode_num,
-            "merge",
-            f'mkvmerge -o "{str(episode_dir / "final_output.mkv")}" --language 0:ja "{str(episode_dir / "video.mkv")}" "{str(episode_dir / f"output{episode_num}.flac")}"',
-            prerequisites=["audio", "video"],
-            work_dir=str(episode_dir)
-        )
-        tasks.append(merge_task)
+        # 合并任务 (合并封装模式下由mux直接使用video.mkv和flac)
+        if not self.use_consolidated_mux:
+            merge_task = EncodingTask(
+                episode_num,
+                "merge",
+                f'mkvmerge -o "{str(episode_dir / "final_output.mkv")}" --language 0:ja "{str(episode_dir / "video.mkv")}" "{str(episode_dir / f"output{episode_num}.flac")}"',
+                prerequisites=["audio", "video"],
+                work_dir=str(episode_dir)
+            )
+            tasks.append(merge_task)
 
         # MUX任务
         mux_tasks = self._generate_mux_task(episode_num)
@@ -528,22 +764,26 @@ class EncodingProject:
         hardsub_merge_tasks = self._generate_hardsub_merge_task(episode_num)
         tasks.extend(hardsub_merge_tasks)
 
-        # 整理任务
-        organize_task = EncodingTask(
-            episode_num,
-            "organize",
-            self._generate_organize_command(episode_num),
-            prerequisites=["mux"] + [f"hardsub_{lang}_merge" for lang in ["chs", "cht"]],
-            work_dir=str(episode_dir)
-        )
-        tasks.append(organize_task)
+        # 整理任务 (合并封装模式下成品已直接写入result目录)
+        if self.use_consolidated_mux:
+            cleanup_prerequisites = ["mux"] + [f"hardsub_{lang}_merge" for lang in ["chs", "cht"]]
+        else:
+            organize_task = EncodingTask(
+                episode_num,
+                "organize",
+                self._generate_organize_command(episode_num),
+                prerequisites=["mux"] + [f"hardsub_{lang}_merge" for lang in ["chs", "cht"]],
+                work_dir=str(episode_dir)
+            )
+            tasks.append(organize_task)
+            cleanup_prerequisites = ["organize"]
         
         # 清理任务
         cleanup_task = EncodingTask(
             episode_num,
             "cleanup",
             f'rm -f "{str(source_path)}"',
-            prerequisites=["organize"],
+            prerequisites=cleanup_prerequisites,
             work_dir=str(episode_dir)
         )
         tasks.append(cleanup_task)
@@ -557,6 +797,11 @@ class EncodingProject:
 
         # 将任务添加到项目中
         self.tasks.extend(tasks)
+        for task in tasks:
+            self.task_index[(task.episode_num, task.task_type)] = task
+
+    def find_task(self, episode_num, task_type):
+        return self.task_index.get((episode_num, task_type))
 
     def _generate_organize_command(self, episode_num):
         episode_dir = self.root_path / f"E{episode_num.zfill(2)}"
@@ -589,7 +834,7 @@ class EncodingProject:
                 episode_num,
                 f"hardsub_{lang}",
                 None,  # 命令先设为None，运行时再构造
-                prerequisites=["merge"],
+                prerequisites=["video"] if self.use_consolidated_mux else ["merge"],
                 work_dir=str(episode_dir)
             )
             hardsub_task.custom_params = {
@@ -629,20 +874,379 @@ sub.set_output(0)
         episode_dir = self.root_path / f"E{episode_num.zfill(2)}"
         tasks = []
 
+        result_dir = self.root_path / "result"
+
         for lang in ["chs", "cht"]:
+            if self.use_consolidated_mux:
+                # 直接写入result目录, 音频来自audio任务而不是merge
+                output_mkv = result_dir / f"E{episode_num.zfill(2)}_{lang}.mkv"
+                prefix = f'mkdir -p "{str(result_dir)}" && '
+                prerequisites = [f"hardsub_{lang}", "audio"]
+            else:
+                output_mkv = episode_dir / f"final_{lang}.mkv"
+                prefix = ''
+                prerequisites = [f"hardsub_{lang}"]
             merge_task = EncodingTask(
                 episode_num,
                 f"hardsub_{lang}_merge",
-                f'mkvmerge -o "{str(episode_dir / f"final_{lang}.mkv")}" ' +
+                prefix +
+                f'mkvmerge -o "{str(output_mkv)}" ' +
                 f'--language 0:und "{str(episode_dir / f"{lang}.mkv")}" ' +
                 f'--language 0:ja "{str(episode_dir / f"audio{episode_num}.aac")}" ' +
                 f'--chapters "{str(list(episode_dir.glob("*.txt"))[0])}"',
-                prerequisites=[f"hardsub_{lang}"]
+                prerequisites=prerequisites
             )
+            merge_task.custom_params = {"output_mkv": str(output_mkv)}
             tasks.append(merge_task)
 
         return tasks
     
+def self_invocation():
+    """调用本脚本子命令的命令前缀; 任务交给agent执行时, agent会把它替换成自己的"""
+    return f'"{sys.executable}" "{os.path.abspath(__file__)}"'
+
+class LocalHandle:
+    """
+    在本机用shell运行的任务进程 (独立进程组).
+    子进程只由等待线程回收: 退出后先读 /proc/<pid>/io, 再用wait4取得CPU时间和峰值内存.
+    """
+    host = "local"
+
+    def __init__(self, command, work_dir, on_output):
+        self.process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            shell=True,
+            cwd=work_dir,
+            preexec_fn=os.setsid  # 创建新的进程组
+        )
+        self.pid = self.process.pid
+        self.rusage = None
+        self.io = None
+        self.stopping = False
+        self.exited = threading.Event()
+        self.output_done = threading.Event()
+        threading.Thread(target=self._read_output, args=(on_output,), daemon=True).start()
+        threading.Thread(target=self._wait, daemon=True).start()
+
+    @property
+    def returncode(self):
+        return self.process.returncode
+
+    def _read_output(self, on_output):
+        try:
+            while True:
+                line = self.process.stdout.readline()
+                if not line:  # EOF
+                    break
+                if self.stopping:
+                    break
+                on_output(line)
+        except (IOError, ValueError) as e:
+            # 进程被终止时可能会抛出这些异常
+            if not self.stopping:
+                print(f"Error reading output: {e}")
+        finally:
+            self.output_done.set()
+            # 确保进程被终止
+            try:
+                if not self.exited.wait(1):  # 如果进程还在运行
+                    self._signal(signal.SIGKILL)
+            except Exception as e:
+                print(f"Error in final process cleanup: {e}")
+
+    def _wait(self):
+        try:
+            if hasattr(os, "waitid"):
+                # WNOWAIT: 等待退出但暂不回收, 此时僵尸进程的io统计已包含其全部子进程
+                os.waitid(os.P_PID, self.pid, os.WEXITED | os.WNOWAIT)
+                self.io = read_proc_io(self.pid)
+            # macOS没有 os.waitid 和 /proc, 直接用wait4回收, 不记录读写量
+            _, status, rusage = os.wait4(self.pid, 0)
+            # ru_maxrss 是进程及其已回收子进程中最大的一个, Linux下单位为KB, macOS下为字节
+            max_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+            self.rusage = {"cpu_user": rusage.ru_utime, "cpu_sys": rusage.ru_stime, "max_rss_kb": max_rss_kb}
+            self.process.returncode = os.waitstatus_to_exitcode(status)
+        except ChildProcessError:
+            # 已被其他地方回收
+            self.process.poll()
+        except Exception as e:
+            print(f"Error waiting for process: {e}")
+            self.process.wait()
+        finally:
+            self.exited.set()
+
+    def _signal(self, sig):
+        os.killpg(os.getpgid(self.pid), sig)
+
+    def terminate(self):
+        self.stopping = True
+        self._signal(signal.SIGTERM)
+
+    def kill(self):
+        self.stopping = True
+        self._signal(signal.SIGKILL)
+
+    def pause(self):
+        self._signal(signal.SIGSTOP)
+
+    def resume(self):
+        self._signal(signal.SIGCONT)
+
+    def close(self):
+        # 关闭管道
+        if self.process.stdout:
+            self.process.stdout.close()
+
+class LocalExecutor:
+    """在本机运行任务"""
+
+    def start(self, task, on_output):
+        return LocalHandle(task.command, task.work_dir, on_output)
+
+class RemoteHandle:
+    """
+    交给agent执行的任务. 在被agent领取前排队; 停止、暂停等操作记录下来,
+    agent下次汇报时取走执行. agent超过 AGENT_TIMEOUT 秒没有汇报时视为失败.
+    """
+    AGENT_TIMEOUT = 60
+
+    def __init__(self, coordinator, job_id, task, on_output):
+        self.coordinator = coordinator
+        self.task = task
+        self.on_output = on_output
+        self.job = {
+            "id": job_id,
+            "episode": task.episode_num,
+            "task_type": task.task_type,
+            "command": task.command,
+            "work_dir": task.work_dir,
+            "self_invocation": self_invocation(),
+        }
+        self.host = None
+        self.last_seen = None
+        self.control = None
+        self.rusage = None
+        self.io = None
+        self._returncode = None
+        self.exited = threading.Event()
+        # agent在汇报结束前已发出全部输出, 与 LocalHandle 一致, 结束时置位
+        self.output_done = threading.Event()
+
+    @property
+    def returncode(self):
+        if (self._returncode is None and self.last_seen is not None
+                and time.time() - self.last_seen > self.AGENT_TIMEOUT
+                and self.coordinator.expire(self)):
+            self.on_output(f"agent {self.host} 超过 {self.AGENT_TIMEOUT} 秒没有响应, 任务视为失败\n")
+            self._finish(-1)
+        return self._returncode
+
+    def _finish(self, returncode, rusage=None, io=None):
+        self.rusage = rusage
+        self.io = io
+        self._returncode = returncode
+        self.output_done.set()
+        self.exited.set()
+
+    def claimed(self, agent):
+        self.host = agent
+        self.last_seen = time.time()
+        # 被领取时才真正开始运行, 排队时间计入queue_wait
+        self.task.start_time = datetime.now()
+        self.on_output(f"由 agent {agent} 执行\n")
+
+    def terminate(self):
+        # 还没被领取的直接从队列中移除
+        if not self.coordinator.cancel(self):
+            self.control = "stop"
+
+    def kill(self):
+        self.control = "kill"
+
+    def pause(self):
+        self.control = "pause"
+
+    def resume(self):
+        self.control = "resume"
+
+    def close(self):
+        pass
+
+COORDINATOR_TOKEN_HEADER = "X-BDencode-Token"
+
+def local_addresses():
+    """本机可供监听的IPv4地址, 默认路由所在的局域网地址排在最前"""
+    addresses = []
+    try:
+        # UDP connect 不发送数据, 只用来得到默认路由使用的本机地址
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("192.0.2.1", 9))
+            addresses.append(s.getsockname()[0])
+    except OSError:
+        pass
+    try:
+        addresses += socket.gethostbyname_ex(socket.gethostname())[2]
+    except OSError:
+        pass
+    addresses.append("127.0.0.1")
+    return list(dict.fromkeys(a for a in addresses if not a.startswith("127.") or a == "127.0.0.1"))
+
+class _CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    def _send_json(self, code, data=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8") if data is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        """每个请求都必须带有与协调器相同的令牌"""
+        token = self.headers.get(COORDINATOR_TOKEN_HEADER, "")
+        if hmac.compare_digest(token.encode("utf-8"), self.server.coordinator.token.encode("utf-8")):
+            return True
+        self._send_json(401, {"error": "invalid token"})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/status":
+            self._send_json(200, self.server.coordinator.status())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        coordinator = self.server.coordinator
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            parts = self.path.strip("/").split("/")
+            if parts == ["claim"]:
+                job = coordinator.claim(data["agent"], data.get("types"))
+                self._send_json(200 if job else 204, job)
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "report":
+                control = coordinator.report(parts[1], data["agent"], data.get("lines", []))
+                self._send_json(200, {"control": control})
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "finish":
+                coordinator.finish(parts[1], data["agent"], data["returncode"], data.get("rusage"), data.get("io"))
+                self._send_json(200, {})
+            else:
+                self._send_json(404, {"error": "not found"})
+        except KeyError as e:
+            self._send_json(404, {"error": f"unknown job {e}"})
+        except Exception as e:
+            self._send_json(400, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+class Coordinator:
+    """
+    远程执行器: 一个HTTP服务, 把任务排队给主动来拉取的agent (BDencode.py agent),
+    并接收它们汇报的输出和结果. 各机器需要以相同路径挂载共享存储.
+    agent会执行协调器给出的命令, 因此所有请求都要带上共享令牌, 且只在指定的地址上监听.
+    """
+
+    def __init__(self, token, host="127.0.0.1", port=8765):
+        if not token:
+            raise ValueError("A token is required")
+        self.token = token
+        self.lock = threading.Lock()
+        self.pending = []
+        self.jobs = {}
+        self.agents = {}
+        self.next_id = 1
+        self.server = ThreadingHTTPServer((host, port), _CoordinatorRequestHandler)
+        self.server.coordinator = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def start(self, task, on_output):
+        with self.lock:
+            handle = RemoteHandle(self, str(self.next_id), task, on_output)
+            self.next_id += 1
+            self.jobs[handle.job["id"]] = handle
+            self.pending.append(handle)
+        on_output("等待agent领取\n")
+        return handle
+
+    def cancel(self, handle):
+        with self.lock:
+            if handle not in self.pending:
+                return False
+            self.pending.remove(handle)
+        handle._finish(-signal.SIGTERM)
+        return True
+
+    def claim(self, agent, types=None):
+        with self.lock:
+            self.agents[agent] = time.time()
+            for handle in self.pending:
+                if not types or handle.job["task_type"] in types:
+                    self.pending.remove(handle)
+                    break
+            else:
+                return None
+        handle.claimed(agent)
+        return handle.job
+
+    def expire(self, handle):
+        """
+        agent超时: 从任务表中移除, 之后它的汇报会被拒绝(agent收到后停止进程).
+        返回是否由这次调用移除, 保证只结束一次
+        """
+        with self.lock:
+            if self.jobs.pop(handle.job["id"], None) is None:
+                return False
+            handle.control = "kill"
+        return True
+
+    def _job_for(self, job_id, agent):
+        # 只接受领取该任务的agent的汇报, 不匹配时按未知任务处理
+        handle = self.jobs[job_id]
+        if handle.host != agent:
+            raise KeyError(job_id)
+        return handle
+
+    def report(self, job_id, agent, lines):
+        with self.lock:
+            handle = self._job_for(job_id, agent)
+            self.agents[agent] = time.time()
+            handle.last_seen = time.time()
+            control, handle.control = handle.control, None
+        for line in lines:
+            handle.on_output(line)
+        return control
+
+    def finish(self, job_id, agent, returncode, rusage=None, io=None):
+        with self.lock:
+            handle = self._job_for(job_id, agent)
+            del self.jobs[job_id]
+            self.agents[agent] = time.time()
+        handle._finish(returncode, rusage, io)
+
+    def active_agents(self, timeout=RemoteHandle.AGENT_TIMEOUT):
+        now = time.time()
+        with self.lock:
+            return sorted(name for name, seen in self.agents.items() if now - seen < timeout)
+
+    def status(self):
+        with self.lock:
+            return {
+                "agents": {name: round(time.time() - seen, 1) for name, seen in self.agents.items()},
+                "pending": [h.job for h in self.pending],
+                "running": [{**h.job, "agent": h.host} for h in self.jobs.values() if h.host],
+            }
+
 class LogWindow(tk.Toplevel):
     def __init__(self, root):
         super().__init__(root)
@@ -683,6 +1287,11 @@ class LogWindow(tk.Toplevel):
             self.output_text.see(tk.END)
 
 class EncodingGUI:
+    # "全部开始"时在后台运行、不阻塞后续任务的任务类型 (与视频编码并行)
+    BACKGROUND_TASK_TYPES = ("audio",)
+    # 启动协调器后交给agent执行的任务类型, "全部开始"时同样不等待它们完成
+    REMOTE_TASK_TYPES = ("calibrate", "video", "hardsub_chs", "hardsub_cht")
+
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("BD Encoding Manager")
@@ -691,6 +1300,10 @@ class EncodingGUI:
         self.project = EncodingProject()
         self.running_tasks = {}
         self.output_queues = {}
+        self.local_executor = LocalExecutor()
+        self.coordinator = None
+        # 本次会话第一个任务开始的时间, 之前已完成的前置任务视为此时就绪
+        self.session_start = None
         
         # 创建日志窗口
         self.log_window = LogWindow(self.root)
@@ -698,6 +1311,7 @@ class EncodingGUI:
         # 创建GUI
         self._create_gui()
         self._setup_task_monitor()
+        self._schedule_progress_refresh()
 
     def _create_gui(self):
         # Main container
@@ -709,12 +1323,14 @@ class EncodingGUI:
         main_container.add(left_frame)
         
         # Task tree
-        columns = ("Episode", "Task", "Status", "Duration")
+        columns = ("Episode", "Task", "Status", "Duration", "Progress", "FPS", "Bitrate", "ETA")
         self.tree = ttk.Treeview(left_frame, columns=columns, show="headings")
 
         for col in columns:
             self.tree.heading(col, text=col)
             self.tree.column(col, width=100)
+        # 明显慢于同类型已完成任务的编码
+        self.tree.tag_configure("slow", foreground="red")
 
         scrollbar = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.tree.yview)
         self.tree.configure(yscrollcommand=scrollbar.set)
@@ -736,6 +1352,34 @@ class EncodingGUI:
 
         ttk.Button(project_frame, text="选择项目文件夹", command=self._select_project_folder).pack(pady=5)
 
+        # Distributed encode
+        coordinator_frame = ttk.LabelFrame(control_frame, text="分布式编码（视频/硬字幕交给agent）")
+        coordinator_frame.pack(fill=tk.X, padx=5, pady=5)
+        coordinator_addr_frame = ttk.Frame(coordinator_frame)
+        coordinator_addr_frame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(coordinator_addr_frame, text="监听地址").pack(side=tk.LEFT)
+        addresses = local_addresses()
+        self.coordinator_host_var = tk.StringVar(value=addresses[0])
+        ttk.Combobox(coordinator_addr_frame, textvariable=self.coordinator_host_var, values=addresses,
+                     width=15).pack(side=tk.LEFT, padx=5)
+        ttk.Label(coordinator_addr_frame, text="端口").pack(side=tk.LEFT, padx=5)
+        self.coordinator_port_var = tk.StringVar(value="8765")
+        ttk.Entry(coordinator_addr_frame, textvariable=self.coordinator_port_var, width=8).pack(side=tk.LEFT)
+
+        coordinator_token_frame = ttk.Frame(coordinator_frame)
+        coordinator_token_frame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(coordinator_token_frame, text="令牌").pack(side=tk.LEFT)
+        self.coordinator_token_var = tk.StringVar(value=os.environ.get("BDENCODE_TOKEN") or secrets.token_urlsafe(16))
+        ttk.Entry(coordinator_token_frame, textvariable=self.coordinator_token_var).pack(
+            side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+        coordinator_control_frame = ttk.Frame(coordinator_frame)
+        coordinator_control_frame.pack(fill=tk.X, padx=5, pady=2)
+        self.coordinator_button = ttk.Button(coordinator_control_frame, text="启动协调器", command=self._toggle_coordinator)
+        self.coordinator_button.pack(side=tk.LEFT)
+        self.coordinator_status_var = tk.StringVar(value="未启动")
+        ttk.Label(coordinator_control_frame, textvariable=self.coordinator_status_var).pack(side=tk.LEFT, padx=5)
+
         # Encoding parameters
         params_frame = ttk.LabelFrame(control_frame, text="编码参数")
         params_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -778,6 +1422,36 @@ class EncodingGUI:
 
         ttk.Button(hardsub_frame, text="重置为默认值", command=lambda: self._reset_params("hardsub")).pack(pady=5)
 
+        # Chunked encode
+        chunks_frame = ttk.Frame(params_frame)
+        chunks_frame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(chunks_frame, text="分块编码块数", width=10).pack(side=tk.LEFT)
+        self.chunks_var = tk.StringVar(value=str(self.project.chunks))
+        ttk.Entry(chunks_frame, textvariable=self.chunks_var).pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        # CRF calibration
+        calibration_frame = ttk.LabelFrame(params_frame, text="CRF校准（采样试编码）")
+        calibration_frame.pack(fill=tk.X, padx=5, pady=5)
+
+        self.calibration_vars = {}
+        calibration_labels = {
+            "crfs": "候选CRF",
+            "samples": "采样段数",
+            "sample_frames": "每段帧数",
+            "target_kbps": "目标码率kbps",
+            "target_ssim": "目标SSIM"
+        }
+        for key, label in calibration_labels.items():
+            frame = ttk.Frame(calibration_frame)
+            frame.pack(fill=tk.X, padx=5, pady=2)
+            ttk.Label(frame, text=label, width=10).pack(side=tk.LEFT)
+            var = tk.StringVar(value=str(self.project.calibration[key]))
+            ttk.Entry(frame, textvariable=var).pack(side=tk.LEFT, fill=tk.X, expand=True)
+            self.calibration_vars[key] = var
+        self.calibration_apply_var = tk.BooleanVar(value=self.project.calibration["auto_apply"])
+        ttk.Checkbutton(calibration_frame, text="校准完成后自动应用到该集",
+                        variable=self.calibration_apply_var).pack(anchor=tk.W, padx=5, pady=2)
+
         # Add apply button
         ttk.Button(params_frame, text="应用参数设置", command=self._apply_params).pack(pady=5)
         
@@ -838,6 +1512,7 @@ class EncodingGUI:
         episode_btn_frame.pack(fill=tk.X, pady=5)
         ttk.Button(episode_btn_frame, text="应用到当前集数", command=self._apply_episode_params).pack(side=tk.LEFT, padx=5)
         ttk.Button(episode_btn_frame, text="重置当前集数", command=self._reset_episode_params).pack(side=tk.LEFT, padx=5)
+        ttk.Button(episode_btn_frame, text="应用校准结果", command=self._apply_calibration_result).pack(side=tk.LEFT, padx=5)
 
         # Task control buttons
         button_frame = ttk.LabelFrame(control_frame, text="任务控制")
@@ -864,6 +1539,9 @@ class EncodingGUI:
         ttk.Button(global_btn_frame, text="全部暂停",
                 command=self._pause_all).pack(side=tk.LEFT, padx=5)
 
+        self.season_eta_var = tk.StringVar(value="剩余时间: -")
+        ttk.Label(button_frame, textvariable=self.season_eta_var).pack(fill=tk.X, padx=5, pady=2)
+
         # 控制台容器
         console_container = ttk.Frame(self.right_frame)
         console_container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -894,6 +1572,8 @@ class EncodingGUI:
         self.show_log_window()
         
         def on_closing():
+            if self.coordinator:
+                self.coordinator.shutdown()
             self.log_window.destroy()
             self.root.destroy()
             
@@ -996,6 +1676,22 @@ class EncodingGUI:
         for param, var in self.hardsub_param_vars.items():
             self.project.current_hardsub_x265_params[param] = var.get()
 
+        try:
+            self.project.chunks = max(1, int(self.chunks_var.get()))
+        except ValueError:
+            self.chunks_var.set(str(self.project.chunks))
+
+        for key, var in self.calibration_vars.items():
+            value = var.get().strip()
+            if key in ("samples", "sample_frames"):
+                try:
+                    value = max(1, int(value))
+                except ValueError:
+                    value = self.project.calibration[key]
+                    var.set(str(value))
+            self.project.calibration[key] = value
+        self.project.calibration["auto_apply"] = self.calibration_apply_var.get()
+
         # Save parameters to JSON
         self.project.save_encoding_params()
 
@@ -1047,6 +1743,27 @@ class EncodingGUI:
                 self.project.save_encoding_params()
             messagebox.showinfo("Success", f"E{episode_num} 将使用全局编码参数")
 
+    def _apply_calibration_result(self):
+        """把所选集数 calibration.json 中的建议CRF应用为该集的普通编码参数"""
+        if not self.episode_select.get():
+            return
+
+        episode_num = self.episode_select.get()[1:]  # Remove 'E' prefix
+        calibration_file = self.project.root_path / f"E{episode_num.zfill(2)}" / "calibration.json"
+        if not calibration_file.exists():
+            messagebox.showwarning("Warning", f"E{episode_num} 还没有校准结果")
+            return
+        try:
+            crf = self.project.apply_calibration(episode_num, calibration_file)
+        except Exception as e:
+            messagebox.showerror("Error", f"读取校准结果失败: {str(e)}")
+            return
+        if crf is None:
+            messagebox.showwarning("Warning", "校准结果中没有建议CRF (未设置目标, 或在测试的CRF范围内达不到目标SSIM)")
+            return
+        self._update_episode_params_display()
+        messagebox.showinfo("Success", f"E{episode_num} 的CRF已设为 {crf}")
+
     def _reset_params(self, param_type):
         if param_type == "normal":
             self.project.current_normal_x265_params = self.project.default_normal_x265_params.copy()
@@ -1098,6 +1815,13 @@ class EncodingGUI:
     def _monitor_tasks(self):
         while True:
             for task_id, (task, output_queue) in list(self.running_tasks.items()):
+                # 本机子进程只由 LocalHandle 的等待线程回收, 这里不能调用poll()
+                finished = task.process is not None and task.process.returncode is not None
+                if finished:
+                    # 进程退出时读取线程可能还在读管道中剩下的输出 (最后的进度和统计行),
+                    # 等它读完再结束任务, 否则这些行以及由它们更新的进度会丢失
+                    task.process.output_done.wait(2)
+
                 try:
                     while True:
                         output = output_queue.get_nowait()
@@ -1105,7 +1829,7 @@ class EncodingGUI:
                 except QueueEmpty:
                     pass
 
-                if task.process and task.process.poll() is not None:
+                if finished:
                     self._task_completed(task)
                     del self.running_tasks[task_id]
 
@@ -1120,6 +1844,11 @@ class EncodingGUI:
         # 更新硬字幕编码参数显示
         for param, var in self.hardsub_param_vars.items():
             var.set(str(self.project.current_hardsub_x265_params[param]))
+
+        self.chunks_var.set(str(self.project.chunks))
+        for key, var in self.calibration_vars.items():
+            var.set(str(self.project.calibration[key]))
+        self.calibration_apply_var.set(self.project.calibration["auto_apply"])
                 
     def _setup_project(self, root_path):
         self.project.setup_project(root_path)
@@ -1148,6 +1877,16 @@ class EncodingGUI:
         ttk.Checkbutton(move_frame, text="使用移动模式", 
                         variable=move_var).pack(side=tk.LEFT)
 
+        # 合并封装模式选项
+        consolidated_var = tk.BooleanVar(value=self.project.use_consolidated_mux)
+        ttk.Checkbutton(move_frame, text="直接封装到result (不生成中间mkv)", 
+                        variable=consolidated_var).pack(side=tk.LEFT, padx=10)
+
+        # 校准模式选项
+        calibration_var = tk.BooleanVar(value=self.project.use_calibration)
+        ttk.Checkbutton(move_frame, text="编码前采样校准CRF", 
+                        variable=calibration_var).pack(side=tk.LEFT, padx=10)
+
         patterns = {}
         pattern_labels = {
             "video": "视频文件 (m2ts/mkv)",
@@ -1180,6 +1919,8 @@ class EncodingGUI:
                     self.project.use_move_mode = True
                 else:
                     self.project.use_move_mode = False
+                self.project.use_consolidated_mux = consolidated_var.get()
+                self.project.use_calibration = calibration_var.get()
                     
                 pattern_dict = {k: v.get() for k, v in patterns.items()}
                 print("Using patterns:", pattern_dict)  # 添加调试输出
@@ -1212,30 +1953,24 @@ class EncodingGUI:
         ttk.Button(dialog, text="确认", command=confirm).pack(pady=10)
 
     def _refresh_task_tree(self):
-        # 保存当前选中的项目的值
-        selected_values = []
-        for item in self.tree.selection():
-            values = self.tree.item(item)['values']
-            if values:
-                selected_values.append((values[0], values[1]))  # 保存集数和任务类型
-        
-        # 清除所有项目
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
+        """
+        就地更新任务列表: 每个任务使用固定的item id, 只插入新任务、删除已移除的任务、
+        更新内容有变化的行, 选中状态随item id保留.
+        """
         # 定义任务类型的顺序
         task_type_order = {
             "subtitle_process": 1,
             "subtitle_cleanup": 2,
             "audio": 3,
-            "video": 4,
-            "merge": 5,
-            "mux": 6,
-            "hardsub_chs": 7,
-            "hardsub_cht": 8,
-            "hardsub_chs_merge": 9,
-            "hardsub_cht_merge": 10,
-            "organize": 11
+            "calibrate": 4,
+            "video": 5,
+            "merge": 6,
+            "mux": 7,
+            "hardsub_chs": 8,
+            "hardsub_cht": 9,
+            "hardsub_chs_merge": 10,
+            "hardsub_cht_merge": 11,
+            "organize": 12
         }
 
         # 对任务进行排序
@@ -1247,21 +1982,128 @@ class EncodingGUI:
             )
         )
 
-        # 重新插入所有任务并记录新的item ID
-        new_items = {}
-        for task in sorted_tasks:
-            item_id = self.tree.insert("", tk.END, values=(
+        order = [self._task_item_id(task) for task in sorted_tasks]
+        wanted = set(order)
+        stale = [item_id for item_id in self.tree.get_children() if item_id not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+
+        for index, task in enumerate(sorted_tasks):
+            item_id = order[index]
+            values = (
                 f"E{task.episode_num.zfill(2)}",
                 task.task_type,
                 task.status,
-                self._format_duration(task.start_time, task.end_time)
-            ))
-            new_items[(f"E{task.episode_num.zfill(2)}", task.task_type)] = item_id
+                self._format_duration(task.start_time, task.end_time),
+                *self._format_progress(task)
+            )
+            if not self.tree.exists(item_id):
+                self.tree.insert("", index, iid=item_id, values=values)
+            elif tuple(str(v) for v in self.tree.item(item_id, "values")) != tuple(str(v) for v in values):
+                self.tree.item(item_id, values=values)
+
+        if list(self.tree.get_children()) != order:
+            for index, item_id in enumerate(order):
+                self.tree.move(item_id, "", index)
+
+    def _task_item_id(self, task):
+        return f"{task.episode_num}:{task.task_type}"
+
+    def _task_for_item(self, item_id):
+        episode, task_type = item_id.split(":", 1)
+        return self._find_task(episode, task_type)
+
+    def _format_progress(self, task):
+        """返回 Progress, FPS, Bitrate, ETA 四列的显示内容"""
+        if task.percent is not None:
+            progress = f"{task.percent:.1f}%"
+        elif task.frames_done is not None:
+            progress = str(int(task.frames_done))
+        else:
+            progress = "-"
+        if task.fps is not None:
+            rate = f"{task.fps:.2f}"
+        elif task.speed is not None:
+            rate = f"{task.speed:.1f}x"
+        else:
+            rate = "-"
+        bitrate = f"{task.bitrate:.0f} kb/s" if task.bitrate is not None else "-"
+        eta = self._format_seconds(task.eta) if task.status == "running" and task.eta is not None else "-"
+        return progress, rate, bitrate, eta
+
+    def _format_seconds(self, seconds):
+        seconds = int(seconds)
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+    def _type_averages(self):
+        """本次运行中各类型已完成任务的平均耗时(秒)和平均fps"""
+        durations, fps = {}, {}
+        for task in self.project.tasks:
+            if task.status != "completed" or not task.start_time or not task.end_time:
+                continue
+            elapsed = (task.end_time - task.start_time).total_seconds()
+            if elapsed <= 0:
+                continue  # 启动时已存在输出的任务
+            durations.setdefault(task.task_type, []).append(elapsed)
+            if task.fps is not None:
+                fps.setdefault(task.task_type, []).append(task.fps)
+        return ({k: sum(v) / len(v) for k, v in durations.items()},
+                {k: sum(v) / len(v) for k, v in fps.items()})
+
+    def _season_eta(self):
+        """
+        估计剩余总时间: 运行中的任务用自身的ETA, 未开始的任务用同类型已完成任务的平均耗时.
+        后台任务与其他任务并行, 不计入.
+        返回 (秒数, 无法估计的任务数).
+        """
+        avg_duration, _ = self._type_averages()
+        remaining, unknown = 0.0, 0
+        for task in self.project.tasks:
+            if task.task_type in self.BACKGROUND_TASK_TYPES or task.status == "completed":
+                continue
+            if task.status == "running":
+                if task.eta is not None:
+                    remaining += task.eta
+                elif task.task_type in avg_duration:
+                    elapsed = (datetime.now() - task.start_time).total_seconds()
+                    remaining += max(0.0, avg_duration[task.task_type] - elapsed)
+                else:
+                    unknown += 1
+            elif task.task_type in avg_duration:
+                remaining += avg_duration[task.task_type]
+            else:
+                unknown += 1
+        return remaining, unknown
+
+    def _schedule_progress_refresh(self):
+        self._refresh_progress()
+        self.root.after(1000, self._schedule_progress_refresh)
 
-        # 恢复之前的选择状态
-        for episode, task_type in selected_values:
-            if (episode, task_type) in new_items:
-                self.tree.selection_add(new_items[(episode, task_type)])
+    def _refresh_progress(self):
+        """每秒更新运行中任务的进度列和整季剩余时间, 不重建任务列表"""
+        _, avg_fps = self._type_averages()
+        for task in self.project.tasks:
+            item_id = self._task_item_id(task)
+            if task.status != "running" or not self.tree.exists(item_id):
+                continue
+            values = self._format_progress(task)
+            for col, value in zip(("Progress", "FPS", "Bitrate", "ETA"), values):
+                self.tree.set(item_id, col, value)
+            self.tree.set(item_id, "Duration", self._format_duration(task.start_time, task.end_time))
+            slow = (task.fps is not None and task.task_type in avg_fps
+                    and task.fps < 0.7 * avg_fps[task.task_type])
+            self.tree.item(item_id, tags=("slow",) if slow else ())
+
+        remaining, unknown = self._season_eta()
+        text = f"剩余时间: {self._format_seconds(remaining)}"
+        if unknown:
+            text += f" (另有 {unknown} 个任务暂无估计)"
+        self.season_eta_var.set(text)
+
+        if self.coordinator:
+            agents = self.coordinator.active_agents()
+            self.coordinator_status_var.set(
+                f"端口 {self.coordinator.port}, {len(agents)} 个agent" + (f": {', '.join(agents)}" if agents else ""))
 
     def _format_duration(self, start_time, end_time):
         if not start_time:
@@ -1281,15 +2123,9 @@ class EncodingGUI:
                 messagebox.showwarning("Warning", "No task selected")
                 return
 
-            item = selected_items[0]
-            values = self.tree.item(item)["values"]
-            if values:
-                episode = values[0][1:]  # Remove 'E' prefix
-                task_type = values[1]
-
-                task = self._find_task(episode, task_type)
-                if task and task.status != "running":
-                    self._start_task(task)
+            task = self._task_for_item(selected_items[0])
+            if task and task.status != "running":
+                self._start_task(task)
         except Exception as e:
             print(f"Error in _start_selected: {str(e)}")
             messagebox.showerror("Error", f"Failed to start task: {str(e)}")
@@ -1297,40 +2133,33 @@ class EncodingGUI:
     def _stop_selected(self):
         selected_items = self.tree.selection()
         for item in selected_items:
-            values = self.tree.item(item)["values"]
-            episode = values[0][1:]
-            task_type = values[1]
-
-            task = self._find_task(episode, task_type)
+            task = self._task_for_item(item)
             if task and task.status == "running":
                 self._stop_task(task)
 
     def _pause_selected(self):
         selected_items = self.tree.selection()
         for item in selected_items:
-            values = self.tree.item(item)["values"]
-            episode = values[0][1:]
-            task_type = values[1]
-
-            task = self._find_task(episode, task_type)
+            task = self._task_for_item(item)
             if task and task.status == "running":
                 self._pause_task(task)
     
-    def _start_all(self):
+    def _start_all(self, rescan=False):
         """Start all tasks in sequence"""
         # Sort tasks by episode number and predefined order
         task_type_order = {
             "subtitle_process": 1,
             "subtitle_cleanup": 2,
             "audio": 3,
-            "video": 4,
-            "merge": 5,
-            "mux": 6,
-            "hardsub_chs": 7,
-            "hardsub_cht": 8,
-            "hardsub_chs_merge": 9,
-            "hardsub_cht_merge": 10,
-            "organize": 11
+            "calibrate": 4,
+            "video": 5,
+            "merge": 6,
+            "mux": 7,
+            "hardsub_chs": 8,
+            "hardsub_cht": 9,
+            "hardsub_chs_merge": 10,
+            "hardsub_cht_merge": 11,
+            "organize": 12
         }
         
         sorted_tasks = sorted(
@@ -1340,14 +2169,24 @@ class EncodingGUI:
         
         def execute_next_task(tasks):
             if not tasks:
+                # 后台任务还在运行时, 稍后重试因其未完成而被跳过的任务
+                if any(t.status == "running" and self._runs_in_background(t)
+                       for t in self.project.tasks):
+                    self.root.after(1000, lambda: self._start_all(rescan=True))
                 return
                 
             task = tasks[0]
-            if task.status not in ["completed", "running"]:
+            # 重新扫描时不重试失败或被停止的任务, 否则失败的后台/远程任务会被反复启动
+            skipped = ["completed", "running", "failed", "stopped"] if rescan else ["completed", "running"]
+            if task.status not in skipped:
                 if self._check_prerequisites(task):
                     self._start_task(task)
-                    # Schedule check for next task
-                    self.root.after(1000, lambda: self._check_task_completion(task, tasks[1:]))
+                    if self._runs_in_background(task):
+                        # 后台任务和交给agent的任务不等待完成, 直接继续下一个
+                        execute_next_task(tasks[1:])
+                    else:
+                        # Schedule check for next task
+                        self.root.after(1000, lambda: self._check_task_completion(task, tasks[1:]))
                 else:
                     # Skip this task and move to next
                     execute_next_task(tasks[1:])
@@ -1369,8 +2208,8 @@ class EncodingGUI:
 
     def _start_all_execute_next(self, remaining_tasks):
         """Execute next task in the sequence"""
-        if remaining_tasks:
-            self._start_all()
+        # 即使列表已走完也重新扫描: 之前因后台任务未完成而跳过的任务此时可能可以开始
+        self._start_all(rescan=True)
 
     def _stop_all(self):
         """Stop all running tasks"""
@@ -1384,11 +2223,43 @@ class EncodingGUI:
             if task.status == "running":
                 self._pause_task(task)
 
+    def _toggle_coordinator(self):
+        """启动或停止接收agent的协调器; 停止时已交给agent的任务不受影响, 但之后无法再汇报"""
+        if self.coordinator:
+            if any(t.status == "running" and isinstance(t.process, RemoteHandle) for t in self.project.tasks):
+                if not messagebox.askyesno("确认", "还有任务在agent上运行, 停止协调器后将无法收到它们的结果。\n确定要停止吗？"):
+                    return
+            self.coordinator.shutdown()
+            self.coordinator = None
+            self.coordinator_button.config(text="启动协调器")
+            self.coordinator_status_var.set("未启动")
+            return
+        host = self.coordinator_host_var.get().strip()
+        token = self.coordinator_token_var.get().strip()
+        if not token:
+            messagebox.showerror("Error", "请设置令牌, agent需要用它连接协调器")
+            return
+        try:
+            self.coordinator = Coordinator(token, host, int(self.coordinator_port_var.get()))
+        except (ValueError, OSError) as e:
+            messagebox.showerror("Error", f"启动协调器失败: {str(e)}")
+            return
+        self.coordinator_button.config(text="停止协调器")
+        self.log_window.append_log(
+            f"协调器已在 {host}:{self.coordinator.port} 启动, 在各编码机上运行: "
+            f"BDencode.py agent http://{host}:{self.coordinator.port} --token <令牌>\n")
+
+    def _executor_for(self, task):
+        if self.coordinator and task.task_type in self.REMOTE_TASK_TYPES:
+            return self.coordinator
+        return self.local_executor
+
+    def _runs_in_background(self, task):
+        return (task.task_type in self.BACKGROUND_TASK_TYPES
+                or (self.coordinator is not None and task.task_type in self.REMOTE_TASK_TYPES))
+
     def _find_task(self, episode, task_type):
-        for task in self.project.tasks:
-            if task.episode_num == episode and task.task_type == task_type:
-                return task
-        return None
+        return self.project.find_task(episode, task_type)
 
     def _start_task(self, task):
         if not self._check_prerequisites(task):
@@ -1401,19 +2272,49 @@ class EncodingGUI:
             params = self.project.get_episode_params(task.episode_num, is_hardsub)
             
             x265_command = self.project.generate_x265_command(params)
-            if isinstance(x265_command, list):
+            if isinstance(x265_command, list) and self.project.chunks > 1:
+                # 分块并行编码, 由本脚本的 chunk-encode 子命令完成切分、编码和拼接
+                x265_params = ' '.join(x265_command[1:])
+                task.command = (
+                    f'{self_invocation()} chunk-encode '
+                    f'--chunks {self.project.chunks} --x265-params={shlex.quote(x265_params)} '
+                    f'"{task.custom_params["input_vpy"]}" "{task.custom_params["output_mkv"]}"'
+                )
+            elif isinstance(x265_command, list):
                 x265_params = ' '.join(x265_command[1:])  # 去掉 "x265" 命令本身
                 task.command = (
-                    f'vspipe -c y4m "{task.custom_params["input_vpy"]}" - | '
+                    f'vspipe -c y4m -p "{task.custom_params["input_vpy"]}" - | '
                     f'x265 --input - --y4m {x265_params} '
                     f'-o "{task.custom_params["output_mkv"]}"'
                 )
             else:
                 task.command = f'{x265_command} --input="{task.custom_params["input_vpy"]}" -o "{task.custom_params["output_mkv"]}"'
 
+        # 校准任务使用运行时的校准设置和该集的tune/preset
+        elif task.task_type == "calibrate":
+            try:
+                task.command = self.project.generate_calibrate_command(
+                    task.episode_num, task.custom_params["input_vpy"], task.custom_params["output_json"])
+            except Exception as e:
+                task.command = None
+                self.log_window.append_log(f"构造校准命令失败: {str(e)}\n")
+
+        # MUX任务同样在运行时构造命令，此时字幕和字体已经生成
+        elif task.task_type == "mux":
+            try:
+                task.command = self.project.generate_mux_command(
+                    task.episode_num, task.custom_params["output_mkv"],
+                    task.custom_params["video_input"], task.custom_params.get("audio_input"))
+            except Exception as e:
+                task.command = None
+                self.log_window.append_log(f"构造MUX命令失败: {str(e)}\n")
+
         task.status = "running"
         task.start_time = datetime.now()
         task.output = []
+        task.reset_progress()
+        task.reset_trace()
+        task.ready_time = self._ready_time(task)
 
         output_queue = Queue.Queue()
         self.output_queues[task] = output_queue
@@ -1424,33 +2325,27 @@ class EncodingGUI:
             return
 
         try:
-            # 创建进程，使用进程组
-            process = subprocess.Popen(
-                task.command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                shell=True,
-                cwd=task.work_dir,
-                preexec_fn=os.setsid  # 创建新的进程组
-            )
-            
-            task.process = process
-            task.status = "running"
-            task.start_time = datetime.now()
+            task.process = self._executor_for(task).start(
+                task, lambda line: self._on_task_output(task, output_queue, line))
             
             self.running_tasks[id(task)] = (task, output_queue)
-            threading.Thread(
-                target=self._read_output,
-                args=(task, process, output_queue),
-                daemon=True
-            ).start()
-
             self._refresh_task_tree()
             
         except Exception as e:
             task.status = "failed"
-            self.log_window.append_log.insert(f"启动任务失败: {str(e)}\n")
+            self.log_window.append_log(f"启动任务失败: {str(e)}\n")
+
+    def _ready_time(self, task):
+        """任务就绪 (所有前置任务完成) 的时间戳, 与开始时间之差即排队时间"""
+        now = time.time()
+        if self.session_start is None:
+            self.session_start = now
+        ready = self.session_start
+        for prereq in task.prerequisites:
+            prereq_task = self._find_task(task.episode_num, prereq)
+            if prereq_task and prereq_task.end_time:
+                ready = max(ready, prereq_task.end_time.timestamp())
+        return min(ready, now)
 
     def _check_prerequisites(self, task):
         if not task.prerequisites:
@@ -1462,26 +2357,10 @@ class EncodingGUI:
                 return False
         return True
 
-    def _read_output(self, task, process, queue):
-        try:
-            while True:
-                line = process.stdout.readline()
-                if not line:  # EOF
-                    break
-                if task.status == "stopped":
-                    break
-                queue.put(line)
-        except (IOError, ValueError) as e:
-            # 进程被终止时可能会抛出这些异常
-            if task.status != "stopped":
-                print(f"Error reading output: {e}")
-        finally:
-            # 确保进程被终止
-            try:
-                if process.poll() is None:  # 如果进程还在运行
-                    os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-            except Exception as e:
-                print(f"Error in final process cleanup: {e}")
+    def _on_task_output(self, task, queue, line):
+        # 进度行只更新任务的进度字段, 由任务列表定时显示, 不写入日志
+        if not task.parse_progress(line):
+            queue.put(line)
 
     def _update_task_output(self, task, output):
         task.output.append(output)
@@ -1490,26 +2369,39 @@ class EncodingGUI:
     def _task_completed(self, task):
         task.end_time = datetime.now()
         task.status = "completed" if task.process.returncode == 0 else "failed"
+        # 以整个任务的平均速度作为该任务的fps, 用于判断之后的同类编码是否偏慢
+        if task.status == "completed" and task.fps is not None and task.frames_done:
+            elapsed = (task.end_time - task.start_time).total_seconds()
+            if elapsed > 0:
+                task.fps = task.frames_done / elapsed
+        if task.task_type == "calibrate" and task.status == "completed" and self.project.calibration["auto_apply"]:
+            try:
+                crf = self.project.apply_calibration(task.episode_num, task.custom_params["output_json"])
+                if crf is not None:
+                    self.log_window.append_log(f"[{task.episode_num}:calibrate] 已将CRF设为 {crf}\n")
+                else:
+                    self.log_window.append_log(
+                        f"[{task.episode_num}:calibrate] 没有建议CRF (未设置目标, 或在测试的CRF范围内达不到目标), "
+                        f"保留原有参数\n")
+            except Exception as e:
+                self.log_window.append_log(f"[{task.episode_num}:calibrate] 应用校准结果失败: {str(e)}\n")
+        self.project.record_trace(task)
         self._refresh_task_tree()
 
     def _stop_task(self, task):
         if task.process:
             try:
-                # 向整个进程组发送 SIGTERM 信号
-                os.killpg(os.getpgid(task.process.pid), signal.SIGTERM)
+                # 向整个进程组发送 SIGTERM 信号 (远程任务由agent转发)
+                task.process.terminate()
                 
                 # 等待进程结束，但最多等待 5 秒
-                try:
-                    task.process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
+                if not task.process.exited.wait(5):
                     # 如果进程没有响应 SIGTERM，使用 SIGKILL 强制终止
-                    os.killpg(os.getpgid(task.process.pid), signal.SIGKILL)
+                    task.process.kill()
+                    task.process.exited.wait(5)
                 
                 # 关闭管道
-                if task.process.stdout:
-                    task.process.stdout.close()
-                if task.process.stderr:
-                    task.process.stderr.close()
+                task.process.close()
                 
                 task.status = "stopped"
                 task.end_time = datetime.now()
@@ -1518,6 +2410,7 @@ class EncodingGUI:
                 task_id = id(task)
                 if task_id in self.running_tasks:
                     del self.running_tasks[task_id]
+                    self.project.record_trace(task)
                 
                 self._refresh_task_tree()
                 
@@ -1535,12 +2428,12 @@ class EncodingGUI:
             try:
                 if task.paused:
                     # 恢复进程组
-                    os.killpg(os.getpgid(task.process.pid), signal.SIGCONT)
+                    task.process.resume()
                     task.paused = False
                     self.log_window.append_log(f"[{task.episode_num}:{task.task_type}] Task resumed\n")
                 else:
                     # 暂停进程组
-                    os.killpg(os.getpgid(task.process.pid), signal.SIGSTOP)
+                    task.process.pause()
                     task.paused = True
                     self.log_window.append_log(f"[{task.episode_num}:{task.task_type}] Task paused\n")
             except ProcessLookupError:
@@ -1549,7 +2442,623 @@ class EncodingGUI:
             except Exception as e:
                 print(f"Error pausing/resuming task: {e}")
 
+def probe_vpy_info(vpy):
+    """用 vspipe --info 读取脚本输出的帧数和帧率 (如 24000/1001)"""
+    output = subprocess.run(["vspipe", "--info", vpy, "-"], capture_output=True, text=True, check=True).stdout
+    frames = int(re.search(r"Frames:\s*(\d+)", output).group(1))
+    fps = re.search(r"FPS:\s*(\d+/\d+)", output).group(1)
+    return frames, fps
+
+def find_scene_cut(vpy, center, radius, num_frames, threshold=0.3):
+    """
+    在 center 附近 ±radius 帧内找场景切换最明显的一帧, 作为分块的起始帧.
+    没有超过阈值的切换时返回 center.
+    """
+    start = max(1, center - radius)
+    end = min(num_frames - 1, center + radius)
+    command = (
+        f'vspipe -c y4m -s {start} -e {end} "{vpy}" - | '
+        f'ffmpeg -hide_banner -loglevel error -i - '
+        f'-vf "scale=480:-2,select=gte(scene\\,0),metadata=print:key=lavfi.scene_score:file=-" -f null -'
+    )
+    output = subprocess.run(command, shell=True, capture_output=True, text=True).stdout
+
+    best_frame, best_score = center, threshold
+    frame = None
+    for line in output.splitlines():
+        match = re.match(r"frame:(\d+)", line)
+        if match:
+            frame = start + int(match.group(1))
+        elif line.startswith("lavfi.scene_score=") and frame is not None:
+            score = float(line.split("=", 1)[1])
+            if score > best_score or (score == best_score and abs(frame - center) < abs(best_frame - center)):
+                best_frame, best_score = frame, score
+    return best_frame
+
+def plan_chunks(vpy, num_frames, chunks, radius=120, threshold=0.3, jobs=None):
+    """按帧数均分出名义分割点, 再吸附到附近的场景切换, 返回 [(start, end), ...] (end不含)"""
+    nominal = [round(i * num_frames / chunks) for i in range(1, chunks)]
+    with ThreadPoolExecutor(max_workers=jobs or len(nominal) or 1) as pool:
+        cuts = list(pool.map(lambda c: find_scene_cut(vpy, c, radius, num_frames, threshold), nominal))
+    bounds = [0] + sorted(set(c for c in cuts if 0 < c < num_frames)) + [num_frames]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def encode_chunk(vpy, start, end, x265_params, output, on_progress=None):
+    """
+    vspipe -s/-e 输出一段帧给x265, 成功后才把临时文件改名为output.
+    给出 on_progress 时解析x265的进度行并回调 (frames, fps, kb/s), 其他输出照常打印.
+    """
+    tmp_output = output + ".tmp"
+    vspipe = subprocess.Popen(["vspipe", "-c", "y4m", "-s", str(start), "-e", str(end - 1), vpy, "-"],
+                              stdout=subprocess.PIPE)
+    x265 = subprocess.Popen(["x265", "--input", "-", "--y4m", *shlex.split(x265_params), "-o", tmp_output],
+                            stdin=vspipe.stdout, stderr=subprocess.PIPE if on_progress else None)
+    vspipe.stdout.close()
+    if on_progress:
+        buffer = b""
+        for data in iter(lambda: x265.stderr.read1(4096), b""):
+            buffer += data
+            *lines, buffer = re.split(rb"[\r\n]", buffer)
+            for line in lines:
+                line = line.decode(errors="replace").strip()
+                match = X265_PROGRESS_RE.search(line)
+                if match:
+                    on_progress(int(match.group(1)), float(match.group(3)), float(match.group(4)))
+                    continue
+                match = X265_FRAMES_RE.search(line)
+                if match:
+                    on_progress(int(match.group(1)), float(match.group(2)), float(match.group(3)))
+                elif line:
+                    print(line, flush=True)
+    x265_returncode = x265.wait()
+    vspipe_returncode = vspipe.wait()
+    if x265_returncode != 0 or vspipe_returncode != 0:
+        raise RuntimeError(f"Chunk {start}-{end} failed (vspipe {vspipe_returncode}, x265 {x265_returncode})")
+    os.replace(tmp_output, output)
+
+def chunk_encode(vpy, output, x265_params, chunks, jobs=None, work_dir=None, radius=120, threshold=0.3):
+    """
+    把一集切成 chunks 段, 分割点吸附到场景切换, 并行编码成独立的闭合GOP流, 再用mkvmerge无损拼接.
+    已完成的块会被保留, 中断后重新运行只编码剩下的块.
+    """
+    work_dir = Path(work_dir or Path(output).with_name(Path(output).stem + "_chunks"))
+    os.makedirs(work_dir, exist_ok=True)
+
+    num_frames, fps = probe_vpy_info(vpy)
+    plan = plan_chunks(vpy, num_frames, chunks, radius, threshold, jobs)
+    print(f"{num_frames} frames @ {fps}, {len(plan)} chunks: {plan}", flush=True)
+
+    # 闭合GOP保证每块从IDR开始, 可以直接拼接
+    if "--no-open-gop" not in x265_params:
+        x265_params += " --no-open-gop"
+    # 文件名包含帧范围: 块数、场景切换或脚本变化使计划改变时, 不会误用覆盖其他帧范围的旧块
+    chunk_outputs = [str(work_dir / f"chunk{i:03d}_{start:06d}-{end:06d}.hevc") for i, (start, end) in enumerate(plan)]
+    current = {Path(p).name for p in chunk_outputs}
+    for stale in list(work_dir.glob("chunk*.hevc")) + list(work_dir.glob("chunk*.hevc.tmp")):
+        if stale.name not in current:
+            print(f"Removing {stale.name}, not part of the current plan", flush=True)
+            stale.unlink()
+
+    # 各块的 (已编码帧数, fps, kb/s), 汇总后按x265的格式输出整集进度
+    progress = {}
+    progress_lock = threading.Lock()
+    finished = threading.Event()
+
+    def report_progress():
+        while not finished.wait(2):
+            with progress_lock:
+                done = sum(p[0] for p in progress.values())
+                fps = sum(p[1] for p in progress.values())
+                weighted = [(p[0], p[2]) for p in progress.values() if p[2]]
+            kbps = sum(f * k for f, k in weighted) / max(1, sum(f for f, _ in weighted))
+            eta = int((num_frames - done) / fps) if fps else 0
+            print(f"[{done * 100 / num_frames:.1f}%] {done}/{num_frames} frames, {fps:.2f} fps, {kbps:.2f} kb/s, "
+                  f"eta {eta // 3600}:{eta % 3600 // 60:02d}:{eta % 60:02d}", flush=True)
+
+    def run(i):
+        start, end = plan[i]
+        if os.path.exists(chunk_outputs[i]):
+            with progress_lock:
+                progress[i] = (end - start, 0.0, 0.0)
+            print(f"Chunk {i} ({start}-{end}) already encoded, skipping", flush=True)
+            return
+
+        def on_progress(frames, fps, kbps):
+            with progress_lock:
+                progress[i] = (frames, fps, kbps)
+
+        t0 = time.time()
+        encode_chunk(vpy, start, end, x265_params, chunk_outputs[i], on_progress)
+        with progress_lock:
+            progress[i] = (end - start, 0.0, progress.get(i, (0, 0.0, 0.0))[2])
+        elapsed = time.time() - t0
+        print(f"Chunk {i} ({start}-{end}, {end - start} frames) done in {elapsed:.1f}s, "
+              f"{(end - start) / elapsed if elapsed > 0 else 0:.2f} fps", flush=True)
+
+    # 长的块先开始
+    order = sorted(range(len(plan)), key=lambda i: plan[i][1] - plan[i][0], reverse=True)
+    threading.Thread(target=report_progress, daemon=True).start()
+    try:
+        with ThreadPoolExecutor(max_workers=jobs or len(plan)) as pool:
+            for future in [pool.submit(run, i) for i in order]:
+                future.result()
+    finally:
+        finished.set()
+
+    tmp_output = str(work_dir / "joined.mkv")
+    command = ["mkvmerge", "-o", tmp_output]
+    for i, chunk_output in enumerate(chunk_outputs):
+        if i:
+            command.append("+")
+        command += ["--default-duration", f"0:{fps}p", chunk_output]
+    result = subprocess.run(command)
+    # mkvmerge 返回1表示有警告, 输出仍然完整
+    if result.returncode not in (0, 1):
+        raise RuntimeError(f"mkvmerge failed to join chunks ({result.returncode})")
+    os.replace(tmp_output, output)
+    # 只删除本次生成的文件, work_dir 可能是用户指定的已有目录
+    for chunk_output in chunk_outputs:
+        os.remove(chunk_output)
+    try:
+        os.rmdir(work_dir)
+    except OSError:
+        pass
+    print(f"Joined {len(plan)} chunks into {output}", flush=True)
+
+def chunk_encode_main(argv):
+    parser = argparse.ArgumentParser(prog="BDencode.py chunk-encode",
+                                     description="Encode one vpy in parallel chunks split at scene cuts.")
+    parser.add_argument("vpy", help="VapourSynth script")
+    parser.add_argument("output", help="Joined output (mkv)")
+    parser.add_argument("--x265-params", required=True, help="x265 parameters, without --input/--y4m/-o")
+    parser.add_argument("--chunks", type=int, default=8, help="Number of chunks")
+    parser.add_argument("--jobs", type=int, help="Chunks encoded at once (default: all)")
+    parser.add_argument("--work-dir", help="Directory for chunk outputs (default: <output>_chunks)")
+    parser.add_argument("--search-radius", type=int, default=120, help="Frames searched around each nominal split")
+    parser.add_argument("--scene-threshold", type=float, default=0.3, help="Minimum ffmpeg scene score for a cut")
+    args = parser.parse_args(argv)
+
+    chunk_encode(args.vpy, args.output, args.x265_params, max(1, args.chunks), args.jobs, args.work_dir,
+                 args.search_radius, args.scene_threshold)
+
+def sample_ranges(num_frames, samples, sample_frames):
+    """在全片均匀取 samples 段, 每段 sample_frames 帧, 返回 [(start, end), ...] (end不含)"""
+    sample_frames = min(sample_frames, max(1, num_frames // samples))
+    ranges = []
+    for i in range(samples):
+        center = round((i + 0.5) * num_frames / samples)
+        start = max(0, min(num_frames - sample_frames, center - sample_frames // 2))
+        ranges.append((start, start + sample_frames))
+    return sorted(set(ranges))
+
+def measure_ssim(vpy, start, end, encoded):
+    """用ffmpeg的ssim滤镜比较编码结果和vspipe输出的同一段原始帧, 返回All项"""
+    command = (
+        f'vspipe -c y4m -s {start} -e {end - 1} "{vpy}" - | '
+        f'ffmpeg -hide_banner -i "{encoded}" -f yuv4mpegpipe -i - '
+        f'-lavfi "[0:v]setpts=N[a];[1:v]setpts=N[b];[a][b]ssim" -f null -'
+    )
+    output = subprocess.run(command, shell=True, capture_output=True, text=True).stderr
+    match = re.search(r"SSIM .*All:([\d.]+)", output)
+    if not match:
+        raise RuntimeError(f"Failed to measure SSIM of {encoded}")
+    return float(match.group(1))
+
+def fit_log_bitrate(points):
+    """对 [(crf, kbps), ...] 做最小二乘拟合 ln(kbps) = a + b * crf, 返回 (a, b)"""
+    n = len(points)
+    xs = [crf for crf, _ in points]
+    ys = [math.log(kbps) for _, kbps in points]
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        raise ValueError("At least two different CRFs are needed to fit the curve")
+    b = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+    return mean_y - b * mean_x, b
+
+def suggest_crf(results, fit, target_kbps=None, target_ssim=None, step=0.5):
+    """
+    有目标SSIM且测量了SSIM时, 取SSIM (CRF间线性插值) 不低于目标的最大CRF;
+    否则按拟合曲线取码率等于目标码率的CRF. 结果按step取整并限制在测试过的CRF范围内.
+    没有目标, 或连测试过的最小CRF都达不到目标SSIM时返回None.
+    """
+    crfs = sorted(r["crf"] for r in results)
+    if target_ssim is not None and all(r.get("ssim") is not None for r in results):
+        ssim = {r["crf"]: r["ssim"] for r in results}
+        if ssim[crfs[0]] < target_ssim:
+            return None
+        crf = crfs[0]
+        for lo, hi in zip(crfs, crfs[1:]):
+            if ssim[hi] >= target_ssim:
+                crf = hi
+            elif ssim[lo] >= target_ssim:
+                crf = lo + (hi - lo) * (ssim[lo] - target_ssim) / (ssim[lo] - ssim[hi])
+                break
+            else:
+                break
+        # 向下取整, 保证不低于目标质量
+        crf = math.floor(crf / step) * step
+    elif target_kbps:
+        a, b = fit
+        crf = round((math.log(target_kbps) - a) / b / step) * step
+    else:
+        return None
+    return min(max(crf, crfs[0]), crfs[-1])
+
+def calibrate(vpy, crfs, tune="lp", preset="slower", samples=6, sample_frames=240, jobs=None,
+              metric=None, target_kbps=None, target_ssim=None, work_dir=None):
+    """
+    在几段采样上以多个CRF并行试编码, 统计码率 (和可选的SSIM), 拟合码率-CRF曲线并给出建议CRF.
+    x265参数与正式编码相同 (同一CRF对应的SAO/deblock规则), 只是只编码采样的帧.
+    """
+    num_frames, fps = probe_vpy_info(vpy)
+    fps_num, fps_den = (int(x) for x in fps.split("/"))
+    ranges = sample_ranges(num_frames, samples, sample_frames)
+    work_dir = Path(work_dir or Path(vpy).with_name("calibration"))
+    os.makedirs(work_dir, exist_ok=True)
+    project = EncodingProject()
+    print(f"{num_frames} frames at {fps} fps, {len(ranges)} sample(s) of {ranges[0][1] - ranges[0][0]} frames, "
+          f"CRF {', '.join(str(c) for c in crfs)}", flush=True)
+
+    def run(job):
+        crf, (start, end) = job
+        x265_params = " ".join(project.generate_x265_command({"crf": crf, "tune": tune, "preset": preset})[1:])
+        output = str(work_dir / f"crf{crf}_{start:06d}-{end:06d}.hevc")
+        # 丢弃进度行, 否则几十个x265的进度会刷满日志
+        encode_chunk(vpy, start, end, x265_params, output, on_progress=lambda *args: None)
+        ssim = measure_ssim(vpy, start, end, output) if metric == "ssim" else None
+        size = os.path.getsize(output)
+        os.remove(output)
+        return crf, end - start, size, ssim
+
+    jobs_list = [(crf, r) for crf in crfs for r in ranges]
+    with ThreadPoolExecutor(max_workers=jobs or len(crfs)) as pool:
+        encoded = list(pool.map(run, jobs_list))
+
+    results = []
+    for crf in crfs:
+        rows = [row for row in encoded if row[0] == crf]
+        frames = sum(row[1] for row in rows)
+        kbps = sum(row[2] for row in rows) * 8 / 1000 / (frames * fps_den / fps_num)
+        ssim = sum(row[3] * row[1] for row in rows) / frames if metric == "ssim" else None
+        results.append({"crf": crf, "kbps": kbps, "ssim": ssim})
+        print(f"CRF {crf:>5}: {kbps:>9.1f} kb/s" + (f", SSIM {ssim:.5f}" if ssim is not None else ""), flush=True)
+
+    fit = fit_log_bitrate([(r["crf"], r["kbps"]) for r in results])
+    suggested = suggest_crf(results, fit, target_kbps, target_ssim)
+    print(f"Fit: ln(kb/s) = {fit[0]:.3f} {fit[1]:+.4f} * CRF "
+          f"(each +1 CRF changes bitrate by {math.exp(fit[1]) - 1:+.1%})", flush=True)
+    if suggested is not None:
+        print(f"Suggested CRF: {suggested} (~{math.exp(fit[0] + fit[1] * suggested):.0f} kb/s)", flush=True)
+    elif target_ssim is not None or target_kbps:
+        print(f"Target not reached within tested CRFs ({crfs[0]}-{crfs[-1]}), no CRF suggested", flush=True)
+    # 采样文件在测量后已逐个删除; work_dir 可能是用户指定的已有目录, 只在为空时删除
+    try:
+        os.rmdir(work_dir)
+    except OSError:
+        pass
+
+    return {
+        "vpy": str(vpy),
+        "frames": num_frames,
+        "fps": fps,
+        "samples": ranges,
+        "tune": tune,
+        "preset": preset,
+        "results": results,
+        "fit": {"a": fit[0], "b": fit[1]},
+        "target_kbps": target_kbps,
+        "target_ssim": target_ssim,
+        "suggested_crf": suggested,
+        "target_reached": suggested is not None if target_ssim is not None or target_kbps else None,
+    }
+
+def calibrate_main(argv):
+    parser = argparse.ArgumentParser(prog="BDencode.py calibrate",
+                                     description="Sample-encode a vpy at several CRFs and fit a bitrate-vs-CRF curve.")
+    parser.add_argument("vpy", help="VapourSynth script")
+    parser.add_argument("--crfs", default="14,16,18,20", help="Comma separated CRFs to try")
+    parser.add_argument("--tune", default="lp", help="x265 tune")
+    parser.add_argument("--preset", default="slower", help="x265 preset")
+    parser.add_argument("--samples", type=int, default=6, help="Number of sampled ranges")
+    parser.add_argument("--sample-frames", type=int, default=240, help="Frames per sampled range")
+    parser.add_argument("--jobs", type=int, help="Sample encodes run at once (default: number of CRFs)")
+    parser.add_argument("--metric", choices=["ssim"], help="Also measure quality (ffmpeg ssim against the vpy output)")
+    parser.add_argument("--target-kbps", type=float, help="Suggest the CRF giving this bitrate")
+    parser.add_argument("--target-ssim", type=float, help="Suggest the highest CRF keeping this SSIM (implies --metric ssim)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--work-dir", help="Directory for sample encodes (default: calibration/ next to the vpy)")
+    args = parser.parse_args(argv)
+
+    crfs = sorted(float(c) if "." in c else int(c) for c in args.crfs.split(",") if c.strip())
+    metric = "ssim" if args.target_ssim is not None else args.metric
+    result = calibrate(args.vpy, crfs, args.tune, args.preset, max(1, args.samples), max(1, args.sample_frames),
+                       args.jobs, metric, args.target_kbps, args.target_ssim, args.work_dir)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
+
+def read_proc_io(pid):
+    """读取 /proc/<pid>/io (rchar, wchar, read_bytes, write_bytes ...), 不可读时返回None"""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f if ":" in line)}
+    except (OSError, ValueError):
+        return None
+
+def load_trace(path):
+    """读取 encode_trace.jsonl, 同一任务只保留最后一次运行的记录"""
+    records = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[(record["episode"], record["task"])] = record
+    return records
+
+def critical_path(records):
+    """
+    从最后结束的任务开始, 沿最后完成的前置任务向前回溯.
+    每一步的 排队时间 + 运行时间 之和即为从第一个任务开始到全部结束的耗时.
+    """
+    if not records:
+        return []
+    key = max(records, key=lambda k: records[k]["end"])
+    path = []
+    while key is not None:
+        record = records[key]
+        path.append(record)
+        prereqs = [(record["episode"], p) for p in record.get("prerequisites") or []
+                   if (record["episode"], p) in records]
+        key = max(prereqs, key=lambda k: records[k]["end"]) if prereqs else None
+    path.reverse()
+    return path
+
+def _format_bytes(n):
+    if n is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+def print_trace_report(records):
+    """打印各阶段合计和关键路径"""
+    if not records:
+        print("No trace records.")
+        return
+    span_start = min(r["start"] for r in records.values())
+    span_end = max(r["end"] for r in records.values())
+    span = span_end - span_start
+
+    stages = {}
+    for record in records.values():
+        stage = stages.setdefault(record["task"], {"n": 0, "wall": 0.0, "cpu": 0.0, "wait": 0.0, "rss": 0,
+                                                    "read": 0, "write": 0, "failed": 0})
+        stage["n"] += 1
+        stage["wall"] += record["wall"]
+        stage["cpu"] += (record.get("cpu_user") or 0) + (record.get("cpu_sys") or 0)
+        stage["wait"] += record.get("queue_wait") or 0
+        stage["rss"] = max(stage["rss"], record.get("max_rss_kb") or 0)
+        stage["read"] += record.get("read_bytes") or 0
+        stage["write"] += record.get("write_bytes") or 0
+        stage["failed"] += record["status"] != "completed"
+
+    print(f"{len(records)} task(s), {span / 3600:.2f}h from first start to last end.\n")
+    print(f"{'stage':<20}{'n':>4}{'wall':>10}{'cpu':>10}{'cores':>7}{'wait':>10}{'peak rss':>10}"
+          f"{'read':>10}{'write':>10}{'disk/s':>10}")
+    for name, stage in sorted(stages.items(), key=lambda x: -x[1]["wall"]):
+        wall = stage["wall"]
+        cores = stage["cpu"] / wall if wall else 0
+        disk_rate = (stage["read"] + stage["write"]) / wall if wall else 0
+        print(f"{name:<20}{stage['n']:>4}{wall / 3600:>9.2f}h{stage['cpu'] / 3600:>9.2f}h{cores:>7.1f}"
+              f"{stage['wait'] / 3600:>9.2f}h{_format_bytes(stage['rss'] * 1024):>10}"
+              f"{_format_bytes(stage['read']):>10}{_format_bytes(stage['write']):>10}"
+              f"{_format_bytes(disk_rate):>10}"
+              + (f"  ({stage['failed']} not completed)" if stage["failed"] else ""))
+
+    path = critical_path(records)
+    print("\nCritical path:")
+    cpu_bound = io_bound = waiting = 0.0
+    for record in path:
+        cpu = (record.get("cpu_user") or 0) + (record.get("cpu_sys") or 0)
+        cores = cpu / record["wall"] if record["wall"] else 0
+        wait = record.get("queue_wait") or 0
+        waiting += wait
+        # 平均占用不足一个核心的阶段主要在等待磁盘 (或管道)
+        if cores >= 1:
+            cpu_bound += record["wall"]
+        else:
+            io_bound += record["wall"]
+        print(f"  E{record['episode'].zfill(2)} {record['task']:<20} wait {wait / 60:>7.1f}m"
+              f"  run {record['wall'] / 60:>7.1f}m  {cores:>5.1f} cores  {record['status']}"
+              + (f"  on {record['host']}" if record.get("host") not in (None, "local") else ""))
+    total = cpu_bound + io_bound + waiting
+    if total:
+        print(f"\nOn the critical path: {cpu_bound / total:.0%} CPU bound (>=1 core), "
+              f"{io_bound / total:.0%} IO/other bound (<1 core), {waiting / total:.0%} queued behind other tasks.")
+
+def report_main(argv):
+    parser = argparse.ArgumentParser(prog="BDencode.py report",
+                                     description="Summarize encode_trace.jsonl: per-stage totals and the critical path.")
+    parser.add_argument("project", help="Project folder, or the trace file itself")
+    args = parser.parse_args(argv)
+
+    path = Path(args.project)
+    if path.is_dir():
+        path = path / "encode_trace.jsonl"
+    if not path.exists():
+        print(f"Error: {path} not found")
+        sys.exit(1)
+    print_trace_report(load_trace(path))
+
+def _post_json(url, data, token, timeout=30):
+    request = urllib.request.Request(url, data=json.dumps(data, ensure_ascii=False).encode("utf-8"),
+                                     headers={"Content-Type": "application/json", COORDINATOR_TOKEN_HEADER: token},
+                                     method="POST")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+        return json.loads(body) if body else None
+
+def agent_run_job(url, name, token, job, handles):
+    """执行领取到的任务, 每秒汇报一次输出并取回停止/暂停等指令, 结束后汇报返回码和资源占用"""
+    # 协调器上调用本脚本子命令的命令前缀换成本机的
+    command = job["command"].replace(job["self_invocation"], self_invocation())
+    label = f"[{job['episode']}:{job['task_type']}]"
+    lines = []
+    lock = threading.Lock()
+
+    def on_output(line):
+        with lock:
+            lines.append(line)
+
+    def flush():
+        with lock:
+            batch, lines[:] = lines[:], []
+        try:
+            return _post_json(f"{url}/jobs/{job['id']}/report", {"agent": name, "lines": batch}, token)["control"]
+        except urllib.error.HTTPError:
+            # 协调器已不认识这个任务 (例如重启过), 没有人会接收结果了
+            return "stop"
+        except OSError:
+            # 协调器暂时不可达, 输出留到下次一起汇报
+            with lock:
+                lines[:0] = batch
+            return None
+
+    print(f"{label} {command}", flush=True)
+    try:
+        handle = LocalHandle(command, job["work_dir"], on_output)
+    except Exception as e:
+        on_output(f"启动任务失败: {str(e)}\n")
+        flush()
+        result = {"agent": name, "returncode": -1}
+    else:
+        handles[job["id"]] = handle
+        while not handle.exited.wait(1):
+            control = flush()
+            try:
+                if control == "stop":
+                    handle.terminate()
+                elif control == "kill":
+                    handle.kill()
+                elif control == "pause":
+                    handle.pause()
+                elif control == "resume":
+                    handle.resume()
+            except ProcessLookupError:
+                pass
+        handle.output_done.wait(5)
+        flush()
+        del handles[job["id"]]
+        result = {"agent": name, "returncode": handle.returncode, "rusage": handle.rusage, "io": handle.io}
+
+    for _ in range(10):
+        try:
+            _post_json(f"{url}/jobs/{job['id']}/finish", result, token)
+            break
+        except urllib.error.HTTPError:
+            break
+        except OSError as e:
+            print(f"{label} Failed to report result, retrying: {e}", flush=True)
+            time.sleep(5)
+    print(f"{label} finished with {result['returncode']}", flush=True)
+
+def run_agent(url, name, token, types=None, slots=1, poll_interval=2):
+    """
+    不断向协调器领取任务, 最多同时执行 slots 个. 没有任务时每 poll_interval 秒问一次,
+    领取请求同时作为空闲时的心跳. Ctrl-C 或令牌被拒绝时停止正在执行的任务并汇报.
+    """
+    url = url.rstrip("/")
+    free_slots = threading.Semaphore(slots)
+    handles = {}
+    workers = []
+    print(f"Agent {name} pulling {', '.join(types) if types else 'all'} tasks from {url} with {slots} slot(s)",
+          flush=True)
+    try:
+        while True:
+            free_slots.acquire()
+            try:
+                job = _post_json(f"{url}/claim", {"agent": name, "types": types}, token)
+            except urllib.error.HTTPError as e:
+                if e.code == 401:
+                    print("Coordinator rejected the token", flush=True)
+                    break
+                print(f"Claim failed: {e}", flush=True)
+                job = None
+            except OSError as e:
+                print(f"Coordinator unreachable: {e}", flush=True)
+                job = None
+            if not job:
+                free_slots.release()
+                time.sleep(poll_interval)
+                continue
+
+            def run(job=job):
+                try:
+                    agent_run_job(url, name, token, job, handles)
+                finally:
+                    free_slots.release()
+
+            worker = threading.Thread(target=run, daemon=True)
+            worker.start()
+            workers = [w for w in workers if w.is_alive()] + [worker]
+    except KeyboardInterrupt:
+        pass
+
+    if handles:
+        print("Stopping running tasks ...", flush=True)
+    for handle in list(handles.values()):
+        try:
+            handle.terminate()
+        except ProcessLookupError:
+            pass
+    for worker in workers:
+        worker.join(10)
+
+def agent_main(argv):
+    parser = argparse.ArgumentParser(prog="BDencode.py agent",
+                                     description="Pull encode tasks from a BDencode coordinator and run them here. "
+                                                 "Project folders must be mounted at the same path as on the coordinator.")
+    parser.add_argument("coordinator", help="Coordinator URL, e.g. http://encode-main:8765")
+    parser.add_argument("--token", default=os.environ.get("BDENCODE_TOKEN"),
+                        help="Token shown in the coordinator GUI (default: $BDENCODE_TOKEN)")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}", help="Agent name shown in the GUI")
+    parser.add_argument("--types", help="Comma separated task types to accept (default: all)")
+    parser.add_argument("--slots", type=int, default=1, help="Tasks run at once")
+    parser.add_argument("--poll-interval", type=float, default=2, help="Seconds between claims when idle")
+    args = parser.parse_args(argv)
+
+    if not args.token:
+        parser.error("--token (or BDENCODE_TOKEN) is required")
+    types = [t.strip() for t in args.types.split(",") if t.strip()] if args.types else None
+
+    # 任务在独立的进程组中运行, 被kill时同样先停止它们, 否则它们会继续运行
+    def on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, on_sigterm)
+    run_agent(args.coordinator, args.name, args.token, types, max(1, args.slots), args.poll_interval)
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "chunk-encode":
+        chunk_encode_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "calibrate":
+        calibrate_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "agent":
+        agent_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "report":
+        report_main(sys.argv[2:])
+        return
+
     gui = EncodingGUI()
     gui.run()
 
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+
+FONT_MIME_TYPES = {".ttf": "font/ttf", ".otf": "font/otf"}
+
+
+def find_episode_folders(root: str):
+    return sorted(p for p in Path(root).iterdir()
+                  if p.is_dir() and len(p.name) == 3 and p.name[0] == "E" and p.name[1:].isdigit())
+
+
+def probe_tracks(fp_mkv: Path):
+    """
+    Return {track id: track type} of a mkv, as reported by `mkvmerge -J`.
+    """
+    proc = subprocess.run(["mkvmerge", "-J", str(fp_mkv)], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"mkvmerge -J failed on {fp_mkv}: {proc.stdout.strip() or proc.stderr.strip()}")
+    return {track["id"]: track["type"] for track in json.loads(proc.stdout).get("tracks", [])}
+
+
+def check_folder(folder: Path, video_track: int = 0, audio_track: int = 1):
+    """
+    Check the structure of one E?? folder and collect what the remux needs.
+
+    Returns (job, errors); job is None when anything is wrong.
+    """
+    errors = []
+    mkv_files = sorted(folder.glob("*.mkv"))
+    ass_files = sorted(folder.glob("*.ass"))
+    txt_files = sorted(folder.glob("*.txt"))
+    fonts_dir = folder / "subsetted_fonts"
+
+    if len(mkv_files) != 1 or len(ass_files) != 2 or len(txt_files) != 1 or not fonts_dir.is_dir():
+        errors.append(f"expected 1 mkv, 2 ass, 1 txt and subsetted_fonts/, found {len(mkv_files)} mkv, "
+                      f"{len(ass_files)} ass, {len(txt_files)} txt, "
+                      f"{'a' if fonts_dir.is_dir() else 'no'} subsetted_fonts/")
+        return None, errors
+
+    chs_ass = [p for p in ass_files if "chs_jpn" in p.name]
+    cht_ass = [p for p in ass_files if "cht_jpn" in p.name]
+    if not chs_ass or not cht_ass:
+        errors.append("missing *chs_jpn*.ass or *cht_jpn*.ass")
+
+    fonts = []
+    for font in sorted(p for p in fonts_dir.rglob("*") if p.is_file()):
+        if font.suffix.lower() in FONT_MIME_TYPES:
+            fonts.append(font)
+        else:
+            print(f"Warning: Unrecognized font file type {font}, skipping.")
+    if not fonts:
+        errors.append("no font files in subsetted_fonts/")
+
+    try:
+        tracks = probe_tracks(mkv_files[0])
+        if tracks.get(video_track) != "video":
+            errors.append(f"track {video_track} of {mkv_files[0].name} is not video (tracks: {tracks})")
+        if tracks.get(audio_track) != "audio":
+            errors.append(f"track {audio_track} of {mkv_files[0].name} is not audio (tracks: {tracks})")
+    except Exception as e:
+        errors.append(str(e))
+
+    if errors:
+        return None, errors
+    return {
+        "folder": folder,
+        "mkv": mkv_files[0],
+        "chapters": txt_files[0],
+        "chs_ass": chs_ass[0],
+        "cht_ass": cht_ass[0],
+        "fonts": fonts,
+        "video_track": video_track,
+        "audio_track": audio_track,
+    }, []
+
+
+def remux_command(job: dict, fp_output: Path):
+    """
+    Build one mkvmerge call taking video and audio straight from the source mkv,
+    so nothing is extracted to a temp dir first.
+    """
+    cmd = [
+        "mkvmerge", "-o", str(fp_output),
+        "--video-tracks", str(job["video_track"]), "--audio-tracks", str(job["audio_track"]),
+        "--no-subtitles", "--no-buttons", "--no-attachments", "--no-chapters",
+        "--language", f"{job['video_track']}:und", "--language", f"{job['audio_track']}:ja",
+        str(job["mkv"]),
+        "--language", "0:zh-ch", "--track-name", "0:简日双语", "--default-track", "0:yes", str(job["chs_ass"]),
+        "--language", "0:zh-tw", "--track-name", "0:繁日双语", "--default-track", "0:no", str(job["cht_ass"]),
+        "--chapters", str(job["chapters"]),
+    ]
+    for font in job["fonts"]:
+        cmd += ["--attachment-mime-type", FONT_MIME_TYPES[font.suffix.lower()], "--attach-file", str(font)]
+    return cmd
+
+
+def remux_folder(job: dict):
+    """
+    Remux one folder into new_<name>.mkv, then replace the source mkv with it.
+    """
+    fp_mkv = job["mkv"]
+    fp_new = fp_mkv.with_name(f"new_{fp_mkv.name}")
+    proc = subprocess.run(remux_command(job, fp_new), capture_output=True, text=True)
+    # mkvmerge exits with 1 on warnings, the output is still complete
+    if proc.returncode not in (0, 1):
+        if fp_new.exists():
+            fp_new.unlink()
+        raise RuntimeError(f"Failed to merge MKV file: {proc.stdout.strip()[-500:]}")
+    os.replace(fp_new, fp_mkv)
+
+
+def organize(root: str = ".", jobs: int = None, jobs_per_device: int = 2):
+    """
+    Remux every E?? folder under root, several at once.
+
+    All folders are validated before any of them is touched. Remuxing is IO bound,
+    so at most jobs_per_device folders run at once on the same filesystem.
+    """
+    for tool in ("mkvmerge",):
+        if shutil.which(tool) is None:
+            raise RuntimeError(f"{tool} is not installed. Please install it and try again.")
+
+    folders = find_episode_folders(root)
+    if not folders:
+        raise RuntimeError(f"No E01-E12 folders found in {os.path.abspath(root)}.")
+
+    print(f"Checking {len(folders)} folder(s) ...")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        checked = list(pool.map(check_folder, folders))
+    problems = [(folder, errors) for folder, (_, errors) in zip(folders, checked) if errors]
+    if problems:
+        for folder, errors in problems:
+            for error in errors:
+                print(f"Error: {folder}: {error}")
+        raise RuntimeError(f"The file structure of {len(problems)} folder(s) is incorrect, nothing was changed.")
+    remux_jobs = [job for job, _ in checked]
+
+    # one semaphore per filesystem, so folders on different disks run side by side
+    device_limits = {}
+    for job in remux_jobs:
+        device = os.stat(job["folder"]).st_dev
+        job["device_limit"] = device_limits.setdefault(device, threading.Semaphore(jobs_per_device))
+    jobs = jobs or len(device_limits) * jobs_per_device
+
+    def run(job):
+        with job["device_limit"]:
+            t0 = time.time()
+            print(f"Processing folder {job['folder']} ...")
+            remux_folder(job)
+            return time.time() - t0
+
+    start = time.time()
+    failed = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run, job): job for job in remux_jobs}
+        for future in as_completed(futures):
+            folder = futures[future]["folder"]
+            try:
+                print(f"Folder {folder} processing completed in {future.result():.1f}s.")
+            except Exception as e:
+                failed.append(folder)
+                print(f"Error: {folder}: {e}")
+
+    print(f"{len(remux_jobs) - len(failed)}/{len(remux_jobs)} folder(s) done in {time.time() - start:.1f}s "
+          f"({len(device_limits)} device(s), up to {jobs_per_device} job(s) each).")
+    if failed:
+        raise RuntimeError(f"{len(failed)} folder(s) failed: {', '.join(str(f) for f in failed)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remux every E?? folder with its subtitles, chapters and subsetted fonts.")
+    parser.add_argument("root", nargs="?", default=".", help="Directory containing the E?? folders.")
+    parser.add_argument("-j", "--jobs", type=int, help="Total folders remuxed at once (default: jobs-per-device x devices).")
+    parser.add_argument("--jobs-per-device", type=int, default=2, help="Folders remuxed at once on the same filesystem.")
+    args = parser.parse_args()
+
+    try:
+        organize(args.root, args.jobs, args.jobs_per_device)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("All operations completed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,15 @@
 # Original by Kukoc@Magic-Raws https://skyeysnow.com/forum.php?mod=viewthread&tid=41638
 import argparse
+import bisect
+import json
 import os
+import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def SEM(
-    fp_vc_input: str,
-    segment_list: list,
-    x26x_param: str,
-    fp_vpy: str,
-    fp_vc_output: str,
-    fp_qpfile: str = None,
-    encoder: str = "x265",
-    force_expand: bool = True
-):
-    """
-    Split, Encode then Merge for closed GOP hevc or avc file.
-    """
-    from vapoursynth import core
-
-    valid_exts = ['.hevc', '.avc', '.265', '.264']
-    ext = os.path.splitext(fp_vc_input)[1]
-    if ext not in valid_exts:
-        raise ValueError(f'Input file invalid.')
-
-    print(f"Input file: {fp_vc_input}")
-    print(f"Segment list: {segment_list}")
-    print(f"Encoder: {encoder}")
-    print(f"x26x parameters: {x26x_param}")
-    print(f"VapourSynth script: {fp_vpy}")
-    print(f"Output file: {fp_vc_output}")
-    print(f"QPFile: {fp_qpfile if fp_qpfile else 'None'}")
-    print(f"Force expand: {force_expand}")
-
+def _setup_path():
     if os.name == 'nt':  # Windows
         path_var = 'Path'
         path_separator = '\\'
@@ -44,133 +22,532 @@ def SEM(
     else:
         os.environ[path_var] = sys.prefix + path_separator + "x26x" + ":" + sys.prefix
 
+def _check_input(fp_vc_input: str):
+    valid_exts = ['.hevc', '.avc', '.265', '.264']
+    ext = os.path.splitext(fp_vc_input)[1]
+    if ext not in valid_exts:
+        raise ValueError(f'Input file invalid.')
+
+def plan_segments(
+    fp_vc_input: str,
+    segment_list: list,
+    force_expand: bool = True,
+    work_dir: str = ".",
+    max_chunk: int = None,
+    keyframes: list = None
+):
+    """
+    Expand (optionally) and merge the requested segments into the list actually re-encoded.
+
+    With ``max_chunk`` merged ranges longer than that are split at internal keyframes into
+    chunks that can be encoded independently.
+    """
+    if (force_expand or max_chunk) and keyframes is None:
+        keyframes = probe_keyframes(fp_vc_input, work_dir)
+
     if force_expand:
-        iframe_segment_list = expand_segment_to_iframe(fp_vc_input, segment_list)
+        iframe_segment_list = expand_segment_to_iframe(fp_vc_input, segment_list, work_dir, keyframes)
     else:
         iframe_segment_list = segment_list
 
     iframe_segment_list = sort_segment(iframe_segment_list)
+    if max_chunk:
+        iframe_segment_list = split_segment_at_keyframes(iframe_segment_list, keyframes, max_chunk)
+    return iframe_segment_list
 
-    qp = None
-    if fp_qpfile:
-        with open(fp_qpfile, "r") as f:
-            qpstr = f.readlines()
-        qpstr = [i for i in qpstr if i != "\n"]
-        qpstr = [i if i.endswith("\n") else i + "\n" for i in qpstr]
-        qpstr = [i[:-3] for i in qpstr]
-        qp = [int(i) for i in qpstr]
+def load_qpfile(fp_qpfile: str):
+    """
+    Parse a qpfile into sorted frame numbers and their ``(frame, type, qp)`` entries.
 
-    file = '_tomerge.mkv'
+    Lines are ``frame type [qp]``; blank lines and ``#`` comments are ignored.
+    """
+    entries = []
+    with open(fp_qpfile, "r") as f:
+        for lineno, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) < 2:
+                raise ValueError(f'Invalid qpfile line {lineno}: {line.strip()}')
+            qp = int(fields[2]) if len(fields) > 2 else None
+            entries.append((int(fields[0]), fields[1], qp))
+    entries.sort(key=lambda e: e[0])
+    return [e[0] for e in entries], entries
+
+def write_segment_qpfile(qp: tuple, seg: list, fp_seg_qpfile: str):
+    """
+    Write the qpfile entries inside [seg[0], seg[1]) rebased to the segment start.
+
+    Returns the path written, or None when the segment has no entries.
+    """
+    qp_frames, qp_entries = qp
+    Iframe1, Iframe2 = seg[0], seg[1]
+    lo = bisect.bisect_left(qp_frames, Iframe1)
+    hi = bisect.bisect_left(qp_frames, Iframe2)
+    if lo == hi:
+        return None
+    with open(fp_seg_qpfile, "w") as f:
+        for frame, frame_type, frame_qp in qp_entries[lo:hi]:
+            f.write(f"{frame - Iframe1} {frame_type}" + (f" {frame_qp}\n" if frame_qp is not None else "\n"))
+    return fp_seg_qpfile
+
+_script_clips = {}
+_script_lock = threading.Lock()
+
+def load_script_clip(fp_vpy: str):
+    """
+    Evaluate a VapourSynth script once in this process and cache its output clip.
+    """
+    import runpy
+    import vapoursynth as vs
+
+    with _script_lock:
+        if fp_vpy not in _script_clips:
+            print(f"Evaluating VapourSynth script in-process: {fp_vpy}")
+            vs.clear_outputs()
+            runpy.run_path(fp_vpy, run_name='__vapoursynth__')
+            output = vs.get_output(0)
+            # R58+ returns a VideoOutputTuple instead of the clip itself
+            _script_clips[fp_vpy] = output.clip if hasattr(output, 'clip') else output
+            vs.clear_outputs()
+        return _script_clips[fp_vpy]
+
+def encode_segment(
+    fp_vpy: str,
+    seg: list,
+    x26x_param: str,
+    fp_seg_output: str,
+    fp_seg_qpfile: str = None,
+    encoder: str = "x265",
+    clip=None
+):
+    """
+    Encode frames [seg[0], seg[1]) of the script into an elementary stream.
+
+    With ``clip`` given the frames are streamed as y4m from that already evaluated clip
+    instead of starting a VSPipe process that evaluates the script again.
+    """
+    Iframe1, Iframe2 = seg[0], seg[1]
+    encoder_command = f'{encoder} {x26x_param}'
+    print(f"Using encoder command: {encoder_command}")
+    print(f"Processing segment: {Iframe1}-{Iframe2}")
+
+    if fp_seg_qpfile:
+        encoder_command += f' --qpfile "{fp_seg_qpfile}"'
+    encoder_command += f' -o "{fp_seg_output}" -'
+
+    if clip is None:
+        command = f'VSPipe "{fp_vpy}" -c y4m -s {Iframe1} -e {Iframe2 - 1} - | {encoder_command}'
+        print(f"Running command: {command}")
+        if os.system(command) != 0:
+            raise RuntimeError(f'Failed to encode segment [{Iframe1}, {Iframe2}].')
+        return
+
+    print(f"Running command: <in-process {fp_vpy} [{Iframe1}, {Iframe2})> | {encoder_command}")
+    proc = subprocess.Popen(encoder_command, shell=True, stdin=subprocess.PIPE)
+    try:
+        clip[Iframe1:Iframe2].output(proc.stdin, y4m=True)
+    except (BrokenPipeError, OSError) as e:
+        print(f"Encoder input closed early: {e}")
+    finally:
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+    if proc.wait() != 0:
+        raise RuntimeError(f'Failed to encode segment [{Iframe1}, {Iframe2}].')
+
+def assemble_segments(
+    fp_vc_input: str,
+    segment_list: list,
+    seg_outputs: list,
+    fp_vc_output: str,
+    work_dir: str = "."
+):
+    """
+    Splice the encoded segments into the untouched parts of the input and extract the result.
+    """
+    from vapoursynth import core
+
+    file = os.path.join(work_dir, '_tomerge.mkv')
 
     print(f"Running mkvmerge: mkvmerge -o \"{file}\" \"{fp_vc_input}\"")
     os.system(f'mkvmerge -o "{file}" "{fp_vc_input}"')
 
-    qp_idx = 0
+    temp_files = [file, file + ".lwi"]
+    parts = []
     last_Iframe = 0
-    for seg in iframe_segment_list:
+    for i, (seg, fp_seg_output) in enumerate(zip(segment_list, seg_outputs)):
         Iframe1, Iframe2 = seg[0], seg[1]
-        tmp_qp = []
-        if qp:
-            while qp_idx < len(qp):
-                Qx = qp[qp_idx]
-                if Qx < Iframe1:
-                    qp_idx += 1
-                elif Iframe1 <= Qx < Iframe2:
-                    tmp_qp += [Qx - Iframe1]
-                    qp_idx += 1
-                else:
-                    break
-            tmp_qp_str = "\n".join([f"{i} K" for i in tmp_qp])
-            with open("tmp_qp.qpfile", "w") as f:
-                f.write(tmp_qp_str)
-
-        # set file ext base on encoder type
-        ext = ".265" if encoder == "x265" else ".264"
-
-        encoder_command = f'{encoder} {x26x_param}'
-        print(f"Using encoder command: {encoder_command}")
-        print(f"Processing segment: {Iframe1}-{Iframe2}")
-
-        if Iframe1 == 0:
-            if qp:
-                command = f'VSPipe "{fp_vpy}" -c y4m -s {Iframe1} -e {Iframe2 - 1} - | {encoder_command} --qpfile "tmp_qp.qpfile" -o "_newseg{ext}" -'
-            else:
-                command = f'VSPipe "{fp_vpy}" -c y4m -s {Iframe1} -e {Iframe2 - 1} - | {encoder_command} -o "_newseg{ext}" -'
-
-            print(f"Running command: {command}")
-            os.system(command)
-
-            print(f"Running mkvmerge for first segment: mkvmerge -o \"_lastseg.mkv\" \"_newseg{ext}\"")
-            os.system(f'mkvmerge -o "_lastseg.mkv" "_newseg{ext}"')
-        else:
-            if os.path.exists("_lastseg.mkv"):
-                print(f"Running mkvmerge for segment: mkvmerge -o \"_newseg.mkv\" --split parts-frames:{last_Iframe+1}-{Iframe1+1} \"{file}\"")
-                os.system(f'mkvmerge -o "_newseg.mkv" --split parts-frames:{last_Iframe+1}-{Iframe1+1} "{file}"')
-                print(f"Merging last segment: mkvmerge -o \"_last.mkv\" \"_lastseg.mkv\" + \"_newseg.mkv\"")
-                os.system(f'mkvmerge -o "_last.mkv" "_lastseg.mkv" + "_newseg.mkv"')
-            else:
-                print(f"Running mkvmerge for split: mkvmerge -o \"_last.mkv\" --split parts-frames:{last_Iframe+1}-{Iframe1+1} \"{file}\"")
-                os.system(f'mkvmerge -o "_last.mkv" --split parts-frames:{last_Iframe+1}-{Iframe1+1} "{file}"')
-
-            if qp:
-                command = f'VSPipe "{fp_vpy}" -c y4m -s {Iframe1} -e {Iframe2 - 1} - | {encoder_command} --qpfile "tmp_qp.qpfile" -o "_newseg{ext}" -'
-            else:
-                command = f'VSPipe "{fp_vpy}" -c y4m -s {Iframe1} -e {Iframe2 - 1} - | {encoder_command} -o "_newseg{ext}" -'
-
-            print(f"Running command: {command}")
-            os.system(command)
 
-            print(f"Running mkvmerge for new segment: mkvmerge -o \"_newseg.mkv\" \"_newseg{ext}\"")
-            os.system(f'mkvmerge -o "_newseg.mkv" "_newseg{ext}"')
+        if Iframe1 > last_Iframe:
+            fp_copy = os.path.join(work_dir, f"_copy{i}.mkv")
+            print(f"Running mkvmerge for split: mkvmerge -o \"{fp_copy}\" --split parts-frames:{last_Iframe+1}-{Iframe1+1} \"{file}\"")
+            os.system(f'mkvmerge -o "{fp_copy}" --split parts-frames:{last_Iframe+1}-{Iframe1+1} "{file}"')
+            parts.append(fp_copy)
 
-            print(f"Merging segments: mkvmerge -o \"_lastseg.mkv\" \"_last.mkv\" + \"_newseg.mkv\"")
-            os.system(f'mkvmerge -o "_lastseg.mkv" "_last.mkv" + "_newseg.mkv"')
+        fp_seg_mkv = os.path.join(work_dir, f"_newseg{i}.mkv")
+        print(f"Running mkvmerge for new segment: mkvmerge -o \"{fp_seg_mkv}\" \"{fp_seg_output}\"")
+        os.system(f'mkvmerge -o "{fp_seg_mkv}" "{fp_seg_output}"')
+        parts.append(fp_seg_mkv)
 
         last_Iframe = Iframe2
 
     if last_Iframe != core.lsmas.LWLibavSource(file).num_frames:
-        print(f"Final mkvmerge for remaining frames: mkvmerge -o \"_newseg.mkv\" --split parts-frames:{last_Iframe+1}- \"{file}\"")
-        os.system(f'mkvmerge -o "_newseg.mkv" --split parts-frames:{last_Iframe+1}- "{file}"')
-        print(f"Merging final segments: mkvmerge -o \"_last.mkv\" \"_lastseg.mkv\" + \"_newseg.mkv\"")
-        os.system(f'mkvmerge -o "_last.mkv" "_lastseg.mkv" + "_newseg.mkv"')
-        print(f"Extracting final output: mkvextract \"_last.mkv\" tracks 0:\"{fp_vc_output}\"")
-        os.system(f'mkvextract "_last.mkv" tracks 0:"{fp_vc_output}"')
-    else:
-        print(f"Extracting final output (no remaining frames): mkvextract \"_lastseg.mkv\" tracks 0:\"{fp_vc_output}\"")
-        os.system(f'mkvextract "_lastseg.mkv" tracks 0:"{fp_vc_output}"')
+        fp_copy = os.path.join(work_dir, "_copy_tail.mkv")
+        print(f"Final mkvmerge for remaining frames: mkvmerge -o \"{fp_copy}\" --split parts-frames:{last_Iframe+1}- \"{file}\"")
+        os.system(f'mkvmerge -o "{fp_copy}" --split parts-frames:{last_Iframe+1}- "{file}"')
+        parts.append(fp_copy)
+
+    fp_last = os.path.join(work_dir, "_last.mkv")
+    parts_str = " + ".join(f'"{p}"' for p in parts)
+    print(f"Merging segments: mkvmerge -o \"{fp_last}\" {parts_str}")
+    os.system(f'mkvmerge -o "{fp_last}" {parts_str}')
+    print(f"Extracting final output: mkvextract \"{fp_last}\" tracks 0:\"{fp_vc_output}\"")
+    os.system(f'mkvextract "{fp_last}" tracks 0:"{fp_vc_output}"')
 
     print(f"Cleaning up temporary files...")
-    os.remove(file)
-    if qp:
-        os.remove("tmp_qp.qpfile")
-    os.remove(f"_newseg{ext}")
-    os.remove("_lastseg.mkv")
-    os.remove("_last.mkv")
-    os.remove("_newseg.mkv")
-    os.remove("_tomerge.mkv.lwi")
+    for fp in temp_files + parts + [fp_last]:
+        if os.path.exists(fp):
+            os.remove(fp)
     print("Cleanup completed.")
 
-def expand_segment_to_iframe(vc_filepath: str, segment_list: list):
+def SEM(
+    fp_vc_input: str,
+    segment_list: list,
+    x26x_param: str,
+    fp_vpy: str,
+    fp_vc_output: str,
+    fp_qpfile: str = None,
+    encoder: str = "x265",
+    force_expand: bool = True,
+    inprocess: bool = False,
+    workers: int = 2,
+    max_chunk: int = None
+):
+    """
+    Split, Encode then Merge for closed GOP hevc or avc file.
+    """
+    _check_input(fp_vc_input)
+
+    print(f"Input file: {fp_vc_input}")
+    print(f"Segment list: {segment_list}")
+    print(f"Encoder: {encoder}")
+    print(f"x26x parameters: {x26x_param}")
+    print(f"VapourSynth script: {fp_vpy}")
+    print(f"Output file: {fp_vc_output}")
+    print(f"QPFile: {fp_qpfile if fp_qpfile else 'None'}")
+    print(f"Force expand: {force_expand}")
+    print(f"In-process: {inprocess}")
+
+    _setup_path()
+
+    iframe_segment_list = plan_segments(fp_vc_input, segment_list, force_expand, max_chunk=max_chunk)
+
+    qp = load_qpfile(fp_qpfile) if fp_qpfile else None
+
+    # set file ext base on encoder type
+    ext = ".265" if encoder == "x265" else ".264"
+
+    clip = load_script_clip(fp_vpy) if inprocess else None
+
+    seg_outputs = []
+    seg_qpfiles = []
+    seg_jobs = []
+    for i, seg in enumerate(iframe_segment_list):
+        fp_seg_qpfile = None
+        if qp:
+            fp_seg_qpfile = write_segment_qpfile(qp, seg, f"_newseg{i}.qpfile")
+            if fp_seg_qpfile:
+                seg_qpfiles.append(fp_seg_qpfile)
+        fp_seg_output = f"_newseg{i}{ext}"
+        seg_jobs.append((seg, fp_seg_output, fp_seg_qpfile))
+        seg_outputs.append(fp_seg_output)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(encode_segment, fp_vpy, seg, x26x_param, fp_seg_output, fp_seg_qpfile, encoder, clip)
+            for seg, fp_seg_output, fp_seg_qpfile in seg_jobs
+        ]
+        for future in futures:
+            future.result()
+
+    assemble_segments(fp_vc_input, iframe_segment_list, seg_outputs, fp_vc_output)
+
+    for fp in seg_outputs + seg_qpfiles:
+        os.remove(fp)
+
+def _format_seconds(seconds: float):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def sample_encode_fps(fp_vpy: str, x26x_param: str, encoder: str, start: int, sample_frames: int):
+    """
+    Time a short throwaway encode of the script, including script startup, and return its fps.
+    """
+    command = f'VSPipe "{fp_vpy}" -c y4m -s {start} -e {start + sample_frames - 1} - | {encoder} {x26x_param} -o "{os.devnull}" -'
+    print(f"Running sample encode: {command}")
+    t0 = time.time()
+    if os.system(command) != 0:
+        raise RuntimeError(f'Sample encode of frames [{start}, {start + sample_frames}) failed.')
+    return sample_frames / max(time.time() - t0, 1e-6)
+
+def plan_report(
+    fp_vc_input: str,
+    segment_list: list,
+    x26x_param: str,
+    fp_vpy: str,
+    encoder: str = "x265",
+    force_expand: bool = True,
+    sample_frames: int = 100,
+    work_dir: str = ".",
+    max_chunk: int = None
+):
+    """
+    Print the segments SEM would re-encode and estimate the encoding time without encoding.
+
+    Returns a dict with the frame counts and the estimated seconds (None without a sample).
+    """
+    _check_input(fp_vc_input)
+    keyframes = probe_keyframes(fp_vc_input, work_dir)
+    num_frames = len(keyframes)
+
+    requested = sort_segment(segment_list)
+    planned = plan_segments(fp_vc_input, segment_list, force_expand, work_dir, max_chunk, keyframes)
+
+    requested_frames = sum(r - l for l, r in requested)
+    reencode_frames = sum(r - l for l, r in planned)
+
+    print(f"Plan for {fp_vc_input} ({num_frames} frames, {sum(keyframes)} keyframes):")
+    if force_expand:
+        for l, r, L, R in segment_waste(segment_list, keyframes):
+            print(f"  requested [{l}, {r}] -> keyframes [{L}, {R}): "
+                  f"{l - L} wasted before, {R - r} wasted after")
+    for l, r in planned:
+        asked = sum(max(0, min(r, rr) - max(l, rl)) for rl, rr in requested)
+        print(f"  [{l}, {r}): {r - l} frames re-encoded for {asked} requested")
+    print(f"  Requested frames: {requested_frames}")
+    print(f"  Re-encoded frames: {reencode_frames} ({reencode_frames / num_frames:.1%} of the stream)")
+    print(f"  Copied frames: {num_frames - reencode_frames}")
+    if reencode_frames > requested_frames:
+        print(f"  Keyframe expansion adds {reencode_frames - requested_frames} frames "
+              f"({reencode_frames / max(requested_frames, 1):.1f}x the requested work)")
+
+    estimate = None
+    if sample_frames > 0 and planned:
+        _setup_path()
+        sample = min(sample_frames, num_frames)
+        start = min(planned[0][0], num_frames - sample)
+        fps = sample_encode_fps(fp_vpy, x26x_param, encoder, start, sample)
+        estimate = reencode_frames / fps
+        print(f"  Sample encode: {fps:.2f} fps, estimated encoding time {_format_seconds(estimate)}")
+
+    return {
+        'num_frames': num_frames,
+        'requested_frames': requested_frames,
+        'reencode_frames': reencode_frames,
+        'segments': planned,
+        'estimate': estimate
+    }
+
+def load_manifest(fp_manifest: str):
+    """
+    Load a batch manifest (JSON or TOML).
+
+    Top level keys other than ``jobs`` are defaults applied to every job; each job needs
+    ``input``, ``segments``, ``vpy``, ``output`` and ``x26x_param`` and may override
+    ``qpfile``, ``encoder``, ``force_expand``, ``inprocess``, ``max_chunk`` and ``work_dir``.
+    """
+    ext = os.path.splitext(fp_manifest)[1].lower()
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError('TOML manifests require Python 3.11 or newer.')
+        with open(fp_manifest, "rb") as f:
+            manifest = tomllib.load(f)
+    else:
+        with open(fp_manifest, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    defaults = {k: v for k, v in manifest.items() if k != 'jobs'}
+    jobs = []
+    for i, job in enumerate(manifest.get('jobs', [])):
+        job = {**defaults, **job}
+        for key in ['input', 'segments', 'vpy', 'output', 'x26x_param']:
+            if key not in job:
+                raise ValueError(f'Job {i} in manifest is missing "{key}".')
+        if isinstance(job['segments'], str):
+            job['segments'] = json.loads(job['segments'])
+        job.setdefault('qpfile', None)
+        job.setdefault('encoder', 'x265')
+        job.setdefault('force_expand', True)
+        job.setdefault('inprocess', False)
+        job.setdefault('max_chunk', None)
+        job.setdefault('work_dir', f"_sem_{i:03d}_{os.path.splitext(os.path.basename(job['input']))[0]}")
+        jobs.append(job)
+    return defaults, jobs
+
+def SEM_batch(jobs: list, workers: int = 2):
+    """
+    Run the segment encodes of many SEM jobs from one shared worker pool.
+
+    Segments are dispatched longest first across all jobs, so a long episode
+    does not leave the pool idle while the shorter ones are done.
+    """
+    _setup_path()
+
+    for job in jobs:
+        _check_input(job['input'])
+
+    print(f"Planning {len(jobs)} job(s)...")
+    tasks = []
+    for job_idx, job in enumerate(jobs):
+        os.makedirs(job['work_dir'], exist_ok=True)
+        job['plan'] = plan_segments(job['input'], job['segments'], job['force_expand'], job['work_dir'], job['max_chunk'])
+        job['clip'] = load_script_clip(job['vpy']) if job['inprocess'] else None
+        qp = load_qpfile(job['qpfile']) if job['qpfile'] else None
+        ext = ".265" if job['encoder'] == "x265" else ".264"
+        job['seg_outputs'] = []
+        job['seg_qpfiles'] = []
+        job['remaining'] = len(job['plan'])
+        job['timings'] = []
+        for i, seg in enumerate(job['plan']):
+            fp_seg_qpfile = None
+            if qp:
+                fp_seg_qpfile = write_segment_qpfile(qp, seg, os.path.join(job['work_dir'], f"_newseg{i}.qpfile"))
+                if fp_seg_qpfile:
+                    job['seg_qpfiles'].append(fp_seg_qpfile)
+            fp_seg_output = os.path.join(job['work_dir'], f"_newseg{i}{ext}")
+            job['seg_outputs'].append(fp_seg_output)
+            tasks.append((job_idx, seg, fp_seg_qpfile, fp_seg_output))
+        print(f"  {job['input']}: {len(job['plan'])} segment(s) {job['plan']}")
+
+    tasks.sort(key=lambda t: t[1][1] - t[1][0], reverse=True)
+    total_segments = len(tasks)
+    done_segments = 0
+    lock = threading.Lock()
+    failed = []
+    assemble_futures = []
+    start = time.time()
+
+    def run_assemble(job):
+        t0 = time.time()
+        assemble_segments(job['input'], job['plan'], job['seg_outputs'], job['output'], job['work_dir'])
+        for fp in job['seg_outputs'] + job['seg_qpfiles']:
+            os.remove(fp)
+        print(f"[done] {job['output']} assembled in {time.time() - t0:.1f}s")
+
+    def run_segment(task):
+        nonlocal done_segments
+        job_idx, seg, fp_seg_qpfile, fp_seg_output = task
+        job = jobs[job_idx]
+        t0 = time.time()
+        try:
+            encode_segment(job['vpy'], seg, job['x26x_param'], fp_seg_output, fp_seg_qpfile, job['encoder'], job['clip'])
+        except Exception as e:
+            with lock:
+                failed.append((job['input'], seg, str(e)))
+            raise
+        elapsed = time.time() - t0
+        with lock:
+            done_segments += 1
+            job['remaining'] -= 1
+            job['timings'].append((seg, elapsed))
+            finished = job['remaining'] == 0
+            print(f"[{done_segments}/{total_segments}] {job['input']} segment {seg[0]}-{seg[1]} "
+                  f"({seg[1] - seg[0]} frames) encoded in {elapsed:.1f}s, "
+                  f"{(seg[1] - seg[0]) / elapsed if elapsed > 0 else 0:.2f} fps")
+        if finished:
+            with lock:
+                assemble_futures.append((job, pool.submit(run_assemble, job)))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_segment, task) for task in tasks]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Segment failed: {e}")
+        for job, future in assemble_futures:
+            try:
+                future.result()
+            except Exception as e:
+                failed.append((job['input'], None, str(e)))
+                print(f"Assembling {job['output']} failed: {e}")
+
+    print(f"Batch finished in {time.time() - start:.1f}s")
+    for job in jobs:
+        status = "failed" if job['remaining'] else "ok"
+        total_time = sum(t for _, t in job['timings'])
+        print(f"  {job['input']} -> {job['output']}: {status}, "
+              f"{len(job['timings'])}/{len(job['plan'])} segment(s), {total_time:.1f}s encoding")
+    if failed:
+        raise RuntimeError(f'{len(failed)} segment(s) failed: {failed}')
+
+def probe_keyframes(vc_filepath: str, work_dir: str = "."):
+    """
+    Return one bool per frame of the stream telling whether it is a keyframe.
+    """
     import xml.etree.ElementTree as xet
 
+    fp_frames = os.path.join(work_dir, 'tmp_frames.xml')
     os.system('ffprobe -hide_banner -v error -threads auto -show_frames -show_entries frame=key_frame ' +
-              f'-of xml -select_streams v:0 -i "{vc_filepath}" > tmp_frames.xml')
-    frames = xet.parse("tmp_frames.xml").getroot()[0]
-    num_frames = len(frames)
+              f'-of xml -select_streams v:0 -i "{vc_filepath}" > "{fp_frames}"')
+    frames = xet.parse(fp_frames).getroot()[0]
+    keyframes = [frame.attrib['key_frame'] == '1' for frame in frames]
+    os.remove(fp_frames)
+    return keyframes
+
+def expand_segment_to_iframe(vc_filepath: str, segment_list: list, work_dir: str = ".", keyframes: list = None):
+    if keyframes is None:
+        keyframes = probe_keyframes(vc_filepath, work_dir)
+    num_frames = len(keyframes)
     iseg_list = []
     for seg in segment_list:
         l, r = seg[0], seg[1]
         if l < 0 or l >= num_frames or r < 0 or r >= num_frames:
             raise ValueError(f'Invalid segment [{l}, {r}]')
-        while l > 0 and frames[l].attrib['key_frame'] != '1':
+        while l > 0 and not keyframes[l]:
             l -= 1
-        while r < num_frames and frames[r].attrib['key_frame'] != '1':
+        while r < num_frames and not keyframes[r]:
             r += 1
         iseg_list += [[l, r]]
-    os.remove('tmp_frames.xml')
     return iseg_list
 
 
+def segment_waste(segment_list: list, keyframes: list):
+    """
+    For each requested segment return ``(l, r, L, R)``: the requested range and the
+    keyframe-aligned range that has to be re-encoded to cover it.
+    """
+    expanded = expand_segment_to_iframe(None, segment_list, keyframes=keyframes)
+    return [(seg[0], seg[1], L, R) for seg, (L, R) in zip(segment_list, expanded)]
+
+
+def split_segment_at_keyframes(segment_list: list, keyframes: list, max_chunk: int):
+    """
+    Split segments longer than ``max_chunk`` frames at keyframes inside them.
+
+    Each cut is made at the last keyframe within ``max_chunk`` frames of the chunk start, or
+    at the first one after it when the GOP is longer than that.
+    """
+    kf_idx = [i for i, is_key in enumerate(keyframes) if is_key]
+    chunk_list = []
+    for seg in segment_list:
+        l, r = seg[0], seg[1]
+        while r - l > max_chunk:
+            i = bisect.bisect_right(kf_idx, l + max_chunk) - 1
+            if i < 0 or kf_idx[i] <= l:
+                i = bisect.bisect_right(kf_idx, l + max_chunk)
+            if i >= len(kf_idx) or kf_idx[i] >= r:
+                break
+            chunk_list += [[l, kf_idx[i]]]
+            l = kf_idx[i]
+        chunk_list += [[l, r]]
+    return chunk_list
+
+
 def sort_segment(segment_list: list):
     segment_list = sorted(segment_list, key=lambda x: x[0])
     merge_list = []
@@ -190,20 +567,59 @@ def sort_segment(segment_list: list):
 def main():
     parser = argparse.ArgumentParser(description="Split, Encode and Merge for HEVC/AVC files.")
 
-    parser.add_argument('input', type=str, help="Path to the input HEVC/AVC file.")
-    parser.add_argument('segments', type=str, help="List of segments to process, e.g., [[0, 100], [200, 300]].")
-    parser.add_argument('x26x_param', type=str, help="Encoding parameters for x264/x265.")
-    parser.add_argument('vapoursynth_script', type=str, help="Path to the VapourSynth script.")
-    parser.add_argument('output', type=str, help="Path to the output file.")
+    parser.add_argument('input', type=str, nargs='?', help="Path to the input HEVC/AVC file.")
+    parser.add_argument('segments', type=str, nargs='?', help="List of segments to process, e.g., [[0, 100], [200, 300]].")
+    parser.add_argument('x26x_param', type=str, nargs='?', help="Encoding parameters for x264/x265.")
+    parser.add_argument('vapoursynth_script', type=str, nargs='?', help="Path to the VapourSynth script.")
+    parser.add_argument('output', type=str, nargs='?', help="Path to the output file.")
     parser.add_argument('--encoder', type=str, choices=['x264', 'x265'], default="x265", help="Select x264 or x265 encoder.")
     parser.add_argument('--qpfile', type=str, help="Path to the QP file (optional).")
     parser.add_argument('--force_expand', action='store_true', help="Force expand segments to I-frames.")
+    parser.add_argument('--manifest', type=str, help="Path to a JSON/TOML manifest listing many inputs to process in one batch.")
+    parser.add_argument('--workers', type=int, help="Number of segments encoded at once (default: 2; in batch mode the manifest 'workers' value, then 2).")
+    parser.add_argument('--inprocess', action='store_true', help="Evaluate the VapourSynth script once and stream segments from it instead of running VSPipe per segment.")
+    parser.add_argument('--max-chunk', type=int, help="Split merged segments longer than this many frames at internal keyframes so they encode in parallel.")
+    parser.add_argument('--plan', action='store_true', help="Only print the segment plan and an estimated runtime, do not encode.")
+    parser.add_argument('--sample-frames', type=int, default=100, help="Frames encoded to measure speed for --plan, 0 to skip (default: 100).")
 
     args = parser.parse_args()
 
+    if args.manifest:
+        defaults, jobs = load_manifest(args.manifest)
+        for job in jobs:
+            if args.inprocess:
+                job['inprocess'] = True
+            if args.max_chunk:
+                job['max_chunk'] = args.max_chunk
+        workers = args.workers or defaults.get('workers', 2)
+        if args.plan:
+            reports = [
+                plan_report(job['input'], job['segments'], job['x26x_param'], job['vpy'],
+                            job['encoder'], job['force_expand'], args.sample_frames,
+                            max_chunk=job['max_chunk'])
+                for job in jobs
+            ]
+            print(f"Total re-encoded frames: {sum(r['reencode_frames'] for r in reports)}, "
+                  f"copied frames: {sum(r['num_frames'] - r['reencode_frames'] for r in reports)}")
+            if all(r['estimate'] is not None for r in reports):
+                total = sum(r['estimate'] for r in reports)
+                print(f"Estimated encoding time: {_format_seconds(total)} serial, "
+                      f"~{_format_seconds(total / workers)} with {workers} workers")
+            return
+        SEM_batch(jobs, workers)
+        return
+
+    if None in (args.input, args.segments, args.x26x_param, args.vapoursynth_script, args.output):
+        parser.error("input, segments, x26x_param, vapoursynth_script and output are required without --manifest")
+
     # Parse segment list from string to list of lists
     segment_list = eval(args.segments)
 
+    if args.plan:
+        plan_report(args.input, segment_list, args.x26x_param, args.vapoursynth_script,
+                    args.encoder, args.force_expand, args.sample_frames, max_chunk=args.max_chunk)
+        return
+
     SEM(
         fp_vc_input=args.input,
         segment_list=segment_list,
@@ -212,7 +628,10 @@ def main():
         fp_vc_output=args.output,
         encoder=args.encoder,
         fp_qpfile=args.qpfile,
-        force_expand=args.force_expand
+        force_expand=args.force_expand,
+        inprocess=args.inprocess,
+        workers=args.workers or 2,
+        max_chunk=args.max_chunk
     )
 
 
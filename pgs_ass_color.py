@@ -5,17 +5,24 @@ import cv2
 import numpy as np
 from pathlib import Path
 import json
+import bisect
 import re
 from typing import Dict, List, Optional, Tuple, Union
 import logging
 import codecs
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 import os
+import sys
+import struct
+import sqlite3
 import datetime
 import ass
 from PIL import Image, ImageTk
 import threading
 import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import argparse
+import time
 from ttkthemes import ThemedTk
 
 
@@ -31,10 +38,29 @@ class QueueHandler(logging.Handler):
         self.log_queue.put(("log", msg))
 
 class PGSColorAnalyzer:
-    def __init__(self, queue=None):
+    METHODS = ("kmeans", "histogram")
+
+    def __init__(self, queue=None, method: str = "kmeans"):
         self.framerate = 23.976
         self.logger = logging.getLogger(__name__)
         self.queue = queue
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown extraction method: {method}")
+        self.method = method
+
+    def analysis_params(self) -> str:
+        """描边颜色提取所用参数, 作为缓存键的一部分; 修改提取算法时需同步更新"""
+        if self.method == "histogram":
+            return "outline-histogram:alpha-crop,samples=20000,bins=5bit,radius=24,fallback=kmeans-pp-seed0"
+        return "outline-kmeans:k=3,attempts=10,white=0-30/180-255,dilate=5x5x3"
+
+    def analyze_image(self, image: np.ndarray) -> Tuple[Optional[str], float]:
+        """按所选方法提取图片描边颜色"""
+        if self.method == "histogram":
+            return self.extract_outline_color_histogram(image)
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = image[:, :, :3]
+        return self.extract_outline_color(image)
 
     def update_progress(self, progress):
         if self.queue:
@@ -83,26 +109,111 @@ class PGSColorAnalyzer:
             self.logger.error(f"Color extraction failed: {str(e)}")
         return None, 0.0
 
-    def parse_xml_and_analyze(self, xml_path: str, images_dir: str) -> List[Dict]:
+    def extract_outline_color_histogram(self, image: np.ndarray, max_samples: int = 20000) -> Tuple[Optional[str], float]:
+        """
+        确定性的快速描边颜色提取: 裁剪到非透明区域, 对描边像素抽样后做粗粒度颜色直方图.
+
+        主色附近像素占比不足一半时 (渐变或多色描边), 回退到固定种子的kmeans.
+        """
         try:
-            tree = ET.parse(xml_path)
-            root = tree.getroot()
-            format_elem = root.find(".//Format")
-            if format_elem is not None:
-                framerate_str = format_elem.get('FrameRate')
-                if framerate_str:
-                    self.framerate = float(framerate_str)
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            alpha = None
+            if image.shape[2] == 4:
+                alpha = image[:, :, 3]
+                image = image[:, :, :3]
+
+            # 裁剪到非透明 (无alpha时为非黑) 区域, 留出膨胀所需的边距
+            visible = alpha > 0 if alpha is not None else image.any(axis=2)
+            rows = np.flatnonzero(visible.any(axis=1))
+            cols = np.flatnonzero(visible.any(axis=0))
+            if len(rows) == 0:
+                return None, 0.0
+            margin = 6
+            y0, y1 = max(rows[0] - margin, 0), rows[-1] + margin + 1
+            x0, x1 = max(cols[0] - margin, 0), cols[-1] + margin + 1
+            image = image[y0:y1, x0:x1]
+
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            white_mask = cv2.inRange(hsv, np.array([0, 0, 180]), np.array([180, 30, 255]))
+            dilated = cv2.dilate(white_mask, np.ones((5, 5), np.uint8), iterations=3)
+            outline = cv2.bitwise_xor(dilated, white_mask) > 0
+            if alpha is not None:
+                outline &= alpha[y0:y1, x0:x1] > 0
+
+            pixels = image[outline]
+            if len(pixels) == 0:
+                return None, 0.0
+            if len(pixels) > max_samples:
+                pixels = pixels[::-(-len(pixels) // max_samples)]
+
+            quantized = (pixels >> 3).astype(np.int32)
+            bins = np.bincount(quantized[:, 0] * 1024 + quantized[:, 1] * 32 + quantized[:, 2], minlength=32768)
+            dominant_bin = int(np.argmax(bins))
+            center = np.array([dominant_bin // 1024, dominant_bin // 32 % 32, dominant_bin % 32]) * 8 + 4
+            near = np.abs(pixels.astype(np.int32) - center).max(axis=1) <= 24
+            confidence = float(near.mean())
+
+            if confidence < 0.5:
+                pixels = np.float32(pixels)
+                criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+                cv2.setRNGSeed(0)
+                _, labels, centers = cv2.kmeans(pixels, min(3, len(pixels)), None, criteria, 3, cv2.KMEANS_PP_CENTERS)
+                counts = np.bincount(labels.ravel(), minlength=len(centers))
+                dominant_idx = int(np.argmax(counts))
+                dominant_color = centers[dominant_idx]
+                confidence = counts[dominant_idx] / counts.sum()
+            else:
+                dominant_color = pixels[near].mean(axis=0)
 
+            color_hex = '#{:02x}{:02x}{:02x}'.format(
+                int(dominant_color[2]),
+                int(dominant_color[1]),
+                int(dominant_color[0])
+            )
+            return color_hex, confidence
+        except Exception as e:
+            self.logger.error(f"Color extraction failed: {str(e)}")
+        return None, 0.0
+
+    def parse_xml_and_analyze(self, xml_path: str, images_dir: str, workers: Optional[int] = None,
+                              use_cache: bool = True, pool: Optional[ProcessPoolExecutor] = None) -> List[Dict]:
+        try:
             results = []
-            images_path = Path(images_dir)
-            total_events = len(root.findall('.//Event'))
+            size = os.path.getsize(xml_path)
+            cache = ColorCache.open(images_dir, self.analysis_params()) if use_cache else None
+            try:
+                with open(xml_path, 'rb') as f:
+                    self._analyze_stream(self._iter_xml_graphics(f, images_dir, results), workers, cache, pool,
+                                         parsed=lambda: f.tell() / size if size else 1.0)
+            finally:
+                if cache:
+                    cache.close()
+            return results
+        except Exception as e:
+            self.logger.error(f"XML parsing failed: {str(e)}")
+            return None
 
-            for i, event in enumerate(root.findall('.//Event'), 1):
-                if self.queue:
-                    self.update_progress(i * 100 / total_events)
+    def _iter_xml_graphics(self, f, images_dir: str, results: List[Dict]):
+        """
+        用iterparse流式读取BDN XML, 逐个产出 (event_data, graphic_data, image_path), 事件按顺序追加到results.
+        处理完的Event元素随即从树中移除, 内存占用不随文件大小增长.
+        """
+        images_path = Path(images_dir)
+        parents = []
+        for action, elem in ET.iterparse(f, events=('start', 'end')):
+            if action == 'start':
+                parents.append(elem)
+                continue
+            parents.pop()
 
-                in_time = event.get('InTC')
-                out_time = event.get('OutTC')
+            if elem.tag == 'Format':
+                framerate_str = elem.get('FrameRate')
+                if framerate_str:
+                    self.framerate = float(framerate_str)
+            elif elem.tag == 'Event':
+                in_time = elem.get('InTC')
+                out_time = elem.get('OutTC')
                 event_data = {
                     'start': self.timecode_to_seconds(in_time),
                     'end': self.timecode_to_seconds(out_time),
@@ -111,31 +222,248 @@ class PGSColorAnalyzer:
                     'graphics': []
                 }
 
-                for graphic in event.findall('Graphic'):
+                for graphic in elem.findall('Graphic'):
                     image_filename = graphic.text
                     image_path = images_path / image_filename
                     if image_path.exists():
-                        image = cv2.imread(str(image_path))
-                        if image is not None:
-                            color, confidence = self.extract_outline_color(image)
-                            graphic_data = {
-                                'filename': image_filename,
-                                'width': int(graphic.get('Width')),
-                                'height': int(graphic.get('Height')),
-                                'x': int(graphic.get('X')),
-                                'y': int(graphic.get('Y')),
-                                'color': color,
-                                'confidence': confidence
-                            }
-                            event_data['graphics'].append(graphic_data)
+                        graphic_data = {
+                            'filename': image_filename,
+                            'width': int(graphic.get('Width')),
+                            'height': int(graphic.get('Height')),
+                            'x': int(graphic.get('X')),
+                            'y': int(graphic.get('Y')),
+                        }
+                        yield event_data, graphic_data, str(image_path)
 
                 results.append(event_data)
+                elem.clear()
+                if parents:
+                    parents[-1].remove(elem)
+
+    def _analyze_stream(self, items, workers: Optional[int] = None, cache: Optional['ColorCache'] = None,
+                        pool: Optional[ProcessPoolExecutor] = None, parsed=None, batch_size: int = 16):
+        """
+        边读取边分析: items 产出 (event_data, graphic_data, image_path), 缓存未命中的图片每 batch_size 张
+        提交一次到进程池, 图片解码与解析重叠进行. 结果按原顺序写回各事件.
+
+        传入 pool 时使用该共享进程池, 否则在第一次未命中时临时创建一个.
+        parsed 返回已读取的比例 (0-1), 用于估算进度.
+        """
+        pending = []  # (event_data, graphic_data, image_path)
+        analyzed = []
+        misses = []
+        batch = []
+        futures = {}  # future -> 该批图片在pending中的下标
+        done = 0
+        last_progress = -1
+        own_pool = pool is None
+
+        def report():
+            nonlocal last_progress
+            if not self.queue:
+                return
+            fraction = (parsed() if parsed else 1.0) * (done / len(pending) if pending else 1.0)
+            progress = int(fraction * 100)
+            if progress > last_progress:
+                last_progress = progress
+                self.update_progress(progress)
+
+        def collect(future):
+            nonlocal done
+            for i, result in zip(futures.pop(future), future.result()):
+                analyzed[i] = result
+                done += 1
+
+        def submit():
+            nonlocal pool
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                           initializer=_init_analysis_worker)
+            futures[pool.submit(_analyze_images, [pending[i][2] for i in batch], self.method)] = list(batch)
+            batch.clear()
+            for future in [future for future in futures if future.done()]:
+                collect(future)
+            report()
+
+        try:
+            for item in items:
+                i = len(pending)
+                pending.append(item)
+                hit = cache.get(item[2]) if cache else ColorCache.MISS
+                if hit is ColorCache.MISS:
+                    analyzed.append(None)
+                    misses.append(i)
+                    batch.append(i)
+                    if len(batch) >= batch_size:
+                        submit()
+                else:
+                    analyzed.append(hit)
+                    done += 1
+            if batch:
+                submit()
+            for future in as_completed(list(futures)):
+                collect(future)
+                report()
+        finally:
+            if own_pool and pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        if cache:
+            self.logger.info(f"Color cache: {len(pending) - len(misses)} hits, {len(misses)} images analyzed")
+            cache.put_many([(pending[i][2], analyzed[i]) for i in misses])
+        if self.queue:
+            self.update_progress(100)
+
+        for (event_data, graphic_data, _), result in zip(pending, analyzed):
+            if result is None:
+                continue
+            graphic_data['color'], graphic_data['confidence'] = result
+            event_data['graphics'].append(graphic_data)
+
+    def parse_sup_and_analyze(self, sup_path: str) -> List[Dict]:
+        """
+        直接解析PGS (.sup) 文件: 流式读取PCS/WDS/PDS/ODS段, 从调色板得到描边颜色.
+
+        返回与 parse_xml_and_analyze 相同的结构, 无需导出XML/PNG, 也不解码图片.
+        没有对应的图片文件, 因此各graphic的 filename 为None, 预览中不显示图片.
+        """
+        try:
+            results = []
+            palettes = {}
+            objects = {}
+            current = None
+            display = None
+            file_size = os.path.getsize(sup_path) or 1
+
+            with open(sup_path, 'rb') as f:
+                for pts, seg_type, payload in self._iter_sup_segments(f):
+                    if seg_type == SUP_PCS:
+                        comp_state, palette_flag, palette_id, num_objects = payload[7], payload[8], payload[9], payload[10]
+                        if comp_state & 0x80:  # Epoch Start
+                            palettes.clear()
+                            objects.clear()
+                        comps = []
+                        offset = 11
+                        for _ in range(num_objects):
+                            obj_id, _, crop_flag, x, y = struct.unpack('>HBBHH', payload[offset:offset + 8])
+                            offset += 8
+                            crop = None
+                            if crop_flag & 0x80:
+                                crop = struct.unpack('>HHHH', payload[offset:offset + 8])
+                                offset += 8
+                            comps.append((obj_id, x, y, crop))
+                        display = {
+                            'pts': pts,
+                            'palette_id': palette_id,
+                            'palette_only': bool(palette_flag & 0x80),
+                            'comps': comps,
+                            'new_objects': False
+                        }
+                    elif seg_type == SUP_PDS:
+                        palette = palettes.setdefault(payload[0], {})
+                        for offset in range(2, len(payload) - 4, 5):
+                            entry_id, y, cr, cb, alpha = payload[offset:offset + 5]
+                            palette[entry_id] = (y, cr, cb, alpha)
+                    elif seg_type == SUP_ODS:
+                        obj_id, _, seq_flag = struct.unpack('>HBB', payload[:4])
+                        if seq_flag & 0x80:  # 首个分片带有长度和尺寸
+                            width, height = struct.unpack('>HH', payload[7:11])
+                            objects[obj_id] = {'width': width, 'height': height, 'data': bytearray(payload[11:])}
+                        elif obj_id in objects:
+                            objects[obj_id]['data'] += payload[4:]
+                        if display is not None:
+                            display['new_objects'] = True
+                    elif seg_type == SUP_END and display is not None:
+                        current = self._finish_display_set(display, current, palettes, objects, results)
+                        display = None
+                        if self.queue:
+                            self.update_progress(f.tell() * 100 / file_size)
 
             return results
         except Exception as e:
-            self.logger.error(f"XML parsing failed: {str(e)}")
+            self.logger.error(f"SUP parsing failed: {str(e)}")
             return None
 
+    def _iter_sup_segments(self, f):
+        while True:
+            header = f.read(13)
+            if len(header) < 13:
+                return
+            if header[:2] != b'PG':
+                raise ValueError(f"Invalid PGS segment header at offset {f.tell() - len(header)}")
+            pts, _, seg_type, size = struct.unpack('>IIBH', header[2:])
+            yield pts, seg_type, f.read(size)
+
+    def _finish_display_set(self, display: Dict, current: Optional[Tuple[Dict, List]], palettes: Dict,
+                            objects: Dict, results: List[Dict]) -> Optional[Tuple[Dict, List]]:
+        """根据一个完整的显示集开始/结束事件, 返回当前显示中的 (event_data, 构图)"""
+        if display['palette_only']:
+            return current
+
+        seconds = display['pts'] / 90000
+        composition = [(obj_id, x, y) for obj_id, x, y, _ in display['comps']]
+        if current is not None and (not composition or composition != current[1] or display['new_objects']):
+            current[0]['end'] = seconds
+            current[0]['end_ass'] = self.seconds_to_ass_time(seconds)
+            current = None
+
+        if composition and current is None:
+            event_data = {
+                'start': seconds,
+                'end': seconds,
+                'start_ass': self.seconds_to_ass_time(seconds),
+                'end_ass': self.seconds_to_ass_time(seconds),
+                'graphics': []
+            }
+            palette = palettes.get(display['palette_id'], {})
+            for obj_id, x, y, crop in display['comps']:
+                obj = objects.get(obj_id)
+                if obj is None:
+                    continue
+                color, confidence = self._palette_outline_color(palette, _rle_color_counts(obj['data']))
+                event_data['graphics'].append({
+                    'filename': None,
+                    'width': crop[2] if crop else obj['width'],
+                    'height': crop[3] if crop else obj['height'],
+                    'x': x,
+                    'y': y,
+                    'color': color,
+                    'confidence': confidence
+                })
+            results.append(event_data)
+            current = (event_data, composition)
+
+        return current
+
+    def _palette_outline_color(self, palette: Dict[int, Tuple[int, int, int, int]],
+                               counts: Dict[int, int]) -> Tuple[Optional[str], float]:
+        """按像素数加权, 在不透明且非白色的调色板项中找出主描边颜色"""
+        entries = []
+        for entry_id, count in counts.items():
+            if entry_id not in palette or count == 0:
+                continue
+            y, cr, cb, alpha = palette[entry_id]
+            if alpha < 128:
+                continue
+            rgb = _ycbcr_to_rgb(y, cb, cr)
+            value = max(rgb)
+            saturation = (value - min(rgb)) * 255 / value if value else 0
+            if saturation <= 30 and value >= 180:  # 与 extract_outline_color 相同的白色范围
+                continue
+            entries.append((rgb, count))
+
+        if not entries:
+            return None, 0.0
+
+        total = sum(count for _, count in entries)
+        dominant = max(entries, key=lambda e: e[1])[0]
+        near = [(rgb, count) for rgb, count in entries
+                if max(abs(rgb[i] - dominant[i]) for i in range(3)) <= 24]
+        near_total = sum(count for _, count in near)
+        color = [sum(rgb[i] * count for rgb, count in near) / near_total for i in range(3)]
+        color_hex = '#{:02x}{:02x}{:02x}'.format(int(color[0]), int(color[1]), int(color[2]))
+        return color_hex, near_total / total
+
     def save_results(self, results: List[Dict], output_path: str):
         try:
             with open(output_path, 'w', encoding='utf-8') as f:
@@ -144,16 +472,209 @@ class PGSColorAnalyzer:
         except Exception as e:
             self.logger.error(f"Failed to save results: {str(e)}")
 
+SUP_PDS = 0x14
+SUP_ODS = 0x15
+SUP_PCS = 0x16
+SUP_WDS = 0x17
+SUP_END = 0x80
+
+def _ycbcr_to_rgb(y: int, cb: int, cr: int) -> Tuple[int, int, int]:
+    """BT.709 有限范围 YCbCr 转 RGB"""
+    y = (y - 16) * 255 / 219
+    cb = (cb - 128) * 255 / 224
+    cr = (cr - 128) * 255 / 224
+    r = y + 1.5748 * cr
+    g = y - 0.1873 * cb - 0.4681 * cr
+    b = y + 1.8556 * cb
+    return tuple(int(min(max(round(c), 0), 255)) for c in (r, g, b))
+
+def _rle_color_counts(data: bytes) -> Dict[int, int]:
+    """统计PGS RLE位图中各调色板索引的像素数, 不展开位图"""
+    counts = defaultdict(int)
+    i, n = 0, len(data)
+    try:
+        while i < n:
+            b = data[i]
+            i += 1
+            if b:
+                counts[b] += 1
+                continue
+            flag = data[i]
+            i += 1
+            if flag == 0:  # 行结束
+                continue
+            length = flag & 0x3F
+            if flag & 0x40:
+                length = (length << 8) | data[i]
+                i += 1
+            color = 0
+            if flag & 0x80:
+                color = data[i]
+                i += 1
+            counts[color] += length
+    except IndexError:
+        pass
+    return counts
+
+class ColorCache:
+    """图片描边颜色分析结果的持久缓存, 以SQLite文件保存在图片目录中"""
+    FILENAME = ".pgs_color_cache.sqlite3"
+    MISS = object()
+
+    def __init__(self, db_path: str, params: str):
+        self.logger = logging.getLogger(__name__)
+        self.params = params
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS colors ("
+            "name TEXT, size INTEGER, mtime_ns INTEGER, params TEXT, "
+            "readable INTEGER, color TEXT, confidence REAL, "
+            "PRIMARY KEY (name, size, mtime_ns, params))"
+        )
+        self.conn.commit()
+
+    @classmethod
+    def open(cls, images_dir: str, params: str) -> Optional['ColorCache']:
+        """打开图片目录中的缓存, 目录不可写等情况下返回None (不使用缓存)"""
+        try:
+            return cls(str(Path(images_dir) / cls.FILENAME), params)
+        except sqlite3.Error as e:
+            logging.getLogger(__name__).warning(f"Color cache unavailable: {str(e)}")
+            return None
+
+    def _key(self, image_path: str) -> Tuple[str, int, int, str]:
+        st = os.stat(image_path)
+        return (os.path.basename(image_path), st.st_size, st.st_mtime_ns, self.params)
+
+    def get(self, image_path: str):
+        """返回缓存的 (color, confidence), 图片无法读取时为None, 未命中时为 ColorCache.MISS"""
+        try:
+            row = self.conn.execute(
+                "SELECT readable, color, confidence FROM colors "
+                "WHERE name = ? AND size = ? AND mtime_ns = ? AND params = ?",
+                self._key(image_path)
+            ).fetchone()
+        except (OSError, sqlite3.Error):
+            return self.MISS
+        if row is None:
+            return self.MISS
+        readable, color, confidence = row
+        return (color, confidence) if readable else None
+
+    def put_many(self, entries: List[Tuple[str, Optional[Tuple[Optional[str], float]]]]):
+        rows = []
+        for image_path, result in entries:
+            try:
+                key = self._key(image_path)
+            except OSError:
+                continue
+            if result is None:
+                rows.append(key + (0, None, None))
+            else:
+                rows.append(key + (1, result[0], float(result[1])))
+        try:
+            self.conn.executemany("INSERT OR REPLACE INTO colors VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Failed to update color cache: {str(e)}")
+
+    def close(self):
+        self.conn.close()
+
+def _init_analysis_worker():
+    # 每个进程单线程运行OpenCV, 避免进程池内线程过度订阅
+    cv2.setNumThreads(1)
+
+def _analyze_image(image_path: str, method: str = "kmeans") -> Optional[Tuple[Optional[str], float]]:
+    """进程池任务: 读取单张图片并提取描边颜色, 无法读取时返回None"""
+    flags = cv2.IMREAD_UNCHANGED if method == "histogram" else cv2.IMREAD_COLOR
+    image = cv2.imread(image_path, flags)
+    if image is None:
+        return None
+    return PGSColorAnalyzer(method=method).analyze_image(image)
+
+def _analyze_images(image_paths: List[str], method: str = "kmeans") -> List[Optional[Tuple[Optional[str], float]]]:
+    """进程池任务: 分析一批图片, 减少逐张提交的进程间通信开销"""
+    return [_analyze_image(image_path, method) for image_path in image_paths]
+
+def compare_extractors(images_dir: str, sample: int = 200) -> Dict[str, float]:
+    """
+    在图片目录的抽样上比较两种描边颜色提取方法的速度和一致性, 以kmeans结果为参照.
+    """
+    image_paths = sorted(str(p) for p in Path(images_dir).glob("*.png"))
+    if not image_paths:
+        raise ValueError(f"No PNG images found in {images_dir}")
+    step = max(1, len(image_paths) // sample)
+    image_paths = image_paths[::step][:sample]
+
+    kmeans = PGSColorAnalyzer(method="kmeans")
+    histogram = PGSColorAnalyzer(method="histogram")
+    times = {"kmeans": 0.0, "histogram": 0.0}
+    distances = []
+    kmeans_unstable = 0
+    compared = 0
+
+    def distance(a: str, b: str) -> int:
+        return max(abs(int(a[i:i + 2], 16) - int(b[i:i + 2], 16)) for i in (1, 3, 5))
+
+    for image_path in image_paths:
+        image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            continue
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        t0 = time.perf_counter()
+        color_k, _ = kmeans.analyze_image(image)
+        t1 = time.perf_counter()
+        color_h, _ = histogram.analyze_image(image)
+        t2 = time.perf_counter()
+        color_k2, _ = kmeans.analyze_image(image)
+        times["kmeans"] += t1 - t0
+        times["histogram"] += t2 - t1
+        if color_k and color_k2 and distance(color_k, color_k2) > 16:
+            kmeans_unstable += 1
+        if color_k and color_h:
+            distances.append(distance(color_k, color_h))
+        compared += 1
+
+    if not compared:
+        raise ValueError("None of the sampled images could be read")
+    distances = np.array(distances) if distances else np.array([255])
+    report = {
+        "images": compared,
+        "kmeans_ms": times["kmeans"] * 1000 / compared,
+        "histogram_ms": times["histogram"] * 1000 / compared,
+        "agree_16": float((distances <= 16).mean()),
+        "agree_32": float((distances <= 32).mean()),
+        "mean_distance": float(distances.mean()),
+        "kmeans_unstable": kmeans_unstable / compared,
+    }
+    print(f"Images compared: {report['images']}")
+    print(f"kmeans:    {report['kmeans_ms']:.1f} ms/image "
+          f"(differs from itself on re-run for {report['kmeans_unstable']:.1%})")
+    print(f"histogram: {report['histogram_ms']:.1f} ms/image "
+          f"({report['kmeans_ms'] / max(report['histogram_ms'], 1e-9):.1f}x faster)")
+    print(f"Agreement with kmeans: {report['agree_16']:.1%} within 16, {report['agree_32']:.1%} within 32, "
+          f"mean channel distance {report['mean_distance']:.1f}")
+    return report
+
 class ASSColorUpdater:
-    def __init__(self, ass_path: str, colors_json_path: str, images_dir: str, queue=None, preview_callback=None):
+    AMBIGUOUS_POLICIES = ("dominant", "skip", "review")
+
+    def __init__(self, ass_path: str, colors_json_path: Optional[str], images_dir: str, queue=None,
+                 colors: Optional[List[Dict]] = None, ambiguous_policy: str = "review"):
         self.logger = logging.getLogger(__name__)
         self.ass_doc = self._load_ass(ass_path)
-        self.colors = self._load_colors(colors_json_path)
+        self.colors = colors if colors is not None else self._load_colors(colors_json_path)
+        self._build_interval_index()
         self.images_dir = images_dir
         self.queue = queue
-        self.preview_callback = preview_callback
-        self.color_selection_event = threading.Event()
-        self.selected_color = None
+        if ambiguous_policy not in self.AMBIGUOUS_POLICIES:
+            raise ValueError(f"Unknown ambiguous line policy: {ambiguous_policy}")
+        # 无法自动判断的行: dominant=取占比最高的颜色, skip=跳过, review=先跳过并记录到review_items, 之后用resolve_review处理
+        self.ambiguous_policy = ambiguous_policy
+        self.review_items = []
+        self.review_events = []
 
     def _format_time(self, td: datetime.timedelta) -> str:
         total_seconds = int(td.total_seconds())
@@ -179,6 +700,25 @@ class ASSColorUpdater:
             self.logger.error(f"Failed to load colors JSON: {str(e)}")
             raise
 
+    def _build_interval_index(self):
+        """按开始时间排序PGS事件, 并记录结束时间的前缀最大值, 用于二分查找重叠事件"""
+        self._sorted_events = sorted(self.colors, key=lambda e: e['start'])
+        self._event_starts = [e['start'] for e in self._sorted_events]
+        self._max_end_prefix = []
+        max_end = float('-inf')
+        for event in self._sorted_events:
+            max_end = max(max_end, event['end'])
+            self._max_end_prefix.append(max_end)
+
+    def _events_overlapping(self, start_time: float, end_time: float) -> List[Dict]:
+        """返回与 [start_time, end_time] 重叠的PGS事件"""
+        hi = bisect.bisect_right(self._event_starts, end_time)
+        lo = bisect.bisect_left(self._max_end_prefix, start_time, 0, hi)
+        return [
+            event for event in self._sorted_events[lo:hi]
+            if event['end'] >= start_time
+        ]
+
     def _hex_to_ass_color(self, hex_color: str) -> str:
         try:
             color = hex_color.lstrip('#')
@@ -203,7 +743,9 @@ class ASSColorUpdater:
                         color = graphic['color']
                         if color:  # Check if color is not None
                             color_info[color]['duration'] += duration
-                            color_info[color]['images'].add(os.path.join(self.images_dir, graphic['filename']))
+                            # 来自SUP的graphic没有图片文件
+                            if graphic.get('filename'):
+                                color_info[color]['images'].add(os.path.join(self.images_dir, graphic['filename']))
 
         return {
             color: {
@@ -214,25 +756,8 @@ class ASSColorUpdater:
             if color is not None  # Filter out None colors
         }
 
-    def wait_for_color_selection(self):
-        self.color_selection_event.wait()
-        self.color_selection_event.clear()
-        return self.selected_color
-
-    def set_selected_color(self, color):
-        self.selected_color = color
-        self.color_selection_event.set()
-
-    def skip_current_line(self):
-        """跳过当前行"""
-        self.selected_color = "SKIP"
-        self.color_selection_event.set()
-
     def _find_color_at_time(self, start_time: float, end_time: float) -> Optional[Tuple[str, Dict]]:
-        relevant_events = [
-            event for event in self.colors
-            if event['start'] <= end_time and event['end'] >= start_time
-        ]
+        relevant_events = self._events_overlapping(start_time, end_time)
 
         if not relevant_events:
             return None
@@ -252,16 +777,20 @@ class ASSColorUpdater:
         if dominant_color[1]['percentage'] >= 0.8:
             return dominant_color[0], {}
 
-        # 如果有预览回调函数，发送预览信息并等待选择
-        if self.preview_callback and self.queue:
-            event_data = self._get_current_event()
-            self.preview_callback((event_data, color_info))
-            color = self.wait_for_color_selection()
-            if color == "SKIP":
-                self.queue.put(("log", f"跳过行: {event_data.text}"))
-                return None, {}
-            if color:
-                return color, {}
+        if self.ambiguous_policy == "dominant":
+            return dominant_color[0], {}
+
+        if self.ambiguous_policy == "review":
+            event = self._get_current_event()
+            self.review_items.append({
+                'start': start_time,
+                'end': end_time,
+                'style': event.style if event is not None else None,
+                'text': event.text if event is not None else None,
+                'candidates': color_info,
+                'resolution': None
+            })
+            self.review_events.append(event)
 
         return None, color_info
 
@@ -271,38 +800,144 @@ class ASSColorUpdater:
             return self._current_event
         return None
 
+    def _batch_color_decisions(self, starts: np.ndarray, ends: np.ndarray) -> List[Tuple[Optional[str], bool]]:
+        """
+        一次性计算所有字幕行的颜色占比, 按 _find_color_at_time 的规则自动决定颜色.
+
+        返回每行的 (color, ambiguous); ambiguous 为 True 的行需要人工选择.
+        """
+        n = len(starts)
+        g_start, g_end, g_color = [], [], []
+        color_names = []
+        color_ids = {}
+        for event in self._sorted_events:
+            for graphic in event['graphics']:
+                color = graphic['color']
+                if graphic.get('confidence', 0) > 0.5 and color:
+                    if color not in color_ids:
+                        color_ids[color] = len(color_names)
+                        color_names.append(color)
+                    g_start.append(event['start'])
+                    g_end.append(event['end'])
+                    g_color.append(color_ids[color])
+
+        decisions = [(None, False)] * n
+        if n == 0 or not g_start:
+            return decisions
+
+        g_start = np.asarray(g_start, dtype=np.float64)
+        g_end = np.asarray(g_end, dtype=np.float64)
+        g_color = np.asarray(g_color, dtype=np.int64)
+        g_max_end = np.maximum.accumulate(g_end)
+
+        # 每行的候选图形区间 [lo, hi): 开始时间 <= 行结束, 且此前的最大结束时间 >= 行开始
+        hi = np.searchsorted(g_start, ends, side='right')
+        lo = np.minimum(np.searchsorted(g_max_end, starts, side='left'), hi)
+        counts = hi - lo
+        if counts.sum() == 0:
+            return decisions
+
+        d_idx = np.repeat(np.arange(n), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        g_idx = np.repeat(lo, counts) + offsets
+
+        overlap = np.minimum(g_end[g_idx], ends[d_idx]) - np.maximum(g_start[g_idx], starts[d_idx])
+        mask = overlap > 0
+        d_idx, g_idx, overlap = d_idx[mask], g_idx[mask], overlap[mask]
+        if len(d_idx) == 0:
+            return decisions
+
+        # 按 (行, 颜色) 累加时长, 并记录每种颜色首次出现的位置用于平局时的取舍
+        keys = d_idx * len(color_names) + g_color[g_idx]
+        unique_keys, first_seen, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        durations = np.bincount(inverse, weights=overlap)
+        key_dialogue = unique_keys // len(color_names)
+        key_color = unique_keys % len(color_names)
+        percentage = durations / (ends[key_dialogue] - starts[key_dialogue])
+
+        colors_per_dialogue = np.bincount(key_dialogue, minlength=n)
+        order = np.lexsort((-first_seen, percentage, key_dialogue))
+        last_of_group = np.r_[key_dialogue[order][1:] != key_dialogue[order][:-1], True]
+        dominant = order[last_of_group]
+
+        for k in dominant:
+            d = key_dialogue[k]
+            pct = percentage[k]
+            color = color_names[key_color[k]]
+            if (colors_per_dialogue[d] == 1 and pct > 0.5) or pct >= 0.8:
+                decisions[d] = (color, False)
+            else:
+                decisions[d] = (None, True)
+        return decisions
+
+    def _apply_color(self, event, color: str):
+        start_time = event.start.total_seconds()
+        end_time = event.end.total_seconds()
+        ass_color = self._hex_to_ass_color(color)
+        event.text = self._update_dialogue_text(event.text, ass_color)
+        if self.queue:
+            self.queue.put(("log", f"Updated dialogue at {start_time:.2f}-{end_time:.2f} "
+                                 f"with color {color}"))
+
     def update_dialogues_colors(self):
         updated_count = 0
-        total_dialogues = len([e for e in self.ass_doc.events if isinstance(e, ass.Dialogue)])
-        current_dialogue = 0
+        dialogues = [e for e in self.ass_doc.events if isinstance(e, ass.Dialogue)]
+        starts = np.array([e.start.total_seconds() for e in dialogues], dtype=np.float64)
+        ends = np.array([e.end.total_seconds() for e in dialogues], dtype=np.float64)
+
+        # 第一阶段: 批量自动决定所有非歧义行
+        ambiguous = []
+        for event, (color, is_ambiguous) in zip(dialogues, self._batch_color_decisions(starts, ends)):
+            if is_ambiguous:
+                ambiguous.append(event)
+            elif color:
+                self._apply_color(event, color)
+                updated_count += 1
 
-        for event in self.ass_doc.events:
-            if not isinstance(event, ass.Dialogue):
-                continue
+        if self.queue:
+            self.queue.put(("progress", 100 if not ambiguous else 0))
+            self.queue.put(("log", f"Automatically colored {updated_count} dialogues, "
+                                 f"{len(ambiguous)} need manual selection"))
 
+        # 第二阶段: 计算歧义行的候选颜色, 按策略处理 (review策略只记录, 不等待用户)
+        for i, event in enumerate(ambiguous, 1):
             self._current_event = event  # 保存当前正在处理的事件
-            current_dialogue += 1
             if self.queue:
-                self.queue.put(("progress", current_dialogue * 100 / total_dialogues))
+                self.queue.put(("progress", i * 100 / len(ambiguous)))
 
-            start_time = event.start.total_seconds()
-            end_time = event.end.total_seconds()
-
-            result = self._find_color_at_time(start_time, end_time)
+            result = self._find_color_at_time(event.start.total_seconds(), event.end.total_seconds())
             if not result:
                 continue
 
             color, _ = result
             if color:
-                ass_color = self._hex_to_ass_color(color)
-                event.text = self._update_dialogue_text(event.text, ass_color)
+                self._apply_color(event, color)
                 updated_count += 1
-                if self.queue:
-                    self.queue.put(("log", f"Updated dialogue at {start_time:.2f}-{end_time:.2f} "
-                                         f"with color {color}"))
 
         if self.queue:
             self.queue.put(("log", f"Total updated dialogues: {updated_count}"))
+        return updated_count
+
+    def resolve_review(self, index: int, color: Optional[str]):
+        """
+        处理review列表中的一行, 顺序不限; color为None表示跳过.
+        已处理过的行可以重新选择, 总是从原始文本重新上色.
+        """
+        item = self.review_items[index]
+        event = self.review_events[index]
+        event.text = item['text']
+        if color:
+            self._apply_color(event, color)
+        item['resolution'] = color or "SKIP"
+
+    def pending_reviews(self) -> List[int]:
+        """返回尚未处理的review行的下标"""
+        return [i for i, item in enumerate(self.review_items) if item['resolution'] is None]
+
+    def save_review(self, output_path: str):
+        """保存需要人工确认的行及其候选颜色"""
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(self.review_items, f, indent=2, ensure_ascii=False)
 
     def _update_dialogue_text(self, text: str, new_color: str) -> str:
         color_tag = f"\\3c{new_color}"
@@ -337,7 +972,91 @@ class ASSColorUpdater:
                 self.queue.put(("error", f"Failed to save ASS file: {str(e)}"))
             raise
     
+class ThumbnailCache:
+    """按 (路径, 尺寸) 缓存缩放后的PIL图片 (LRU), 并可在后台线程中预先加载"""
+
+    def __init__(self, capacity: int = 512):
+        self.capacity = capacity
+        self.logger = logging.getLogger(__name__)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._generation = 0
+        self._worker = None
+
+    def get(self, image_path: str, max_size: Tuple[int, int] = (200, 150)) -> Optional[Image.Image]:
+        key = (image_path, tuple(max_size))
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        image = self._load(image_path, max_size)
+        if image is not None:
+            with self._lock:
+                self._items[key] = image
+                self._items.move_to_end(key)
+                while len(self._items) > self.capacity:
+                    self._items.popitem(last=False)
+        return image
+
+    def prefetch(self, image_paths: List[str], max_size: Tuple[int, int] = (200, 150)):
+        """在后台线程中加载图片, 新的请求会取代尚未完成的旧请求"""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        # 预加载不超过一半容量, 以免挤掉正在显示的图片
+        self._pending.put((generation, list(image_paths)[:self.capacity // 2], tuple(max_size)))
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._prefetch_loop, daemon=True)
+            self._worker.start()
+
+    def _prefetch_loop(self):
+        while True:
+            generation, image_paths, max_size = self._pending.get()
+            for image_path in image_paths:
+                if generation != self._generation:
+                    break
+                self.get(image_path, max_size)
+
+    def _load(self, image_path: str, max_size: Tuple[int, int]) -> Optional[Image.Image]:
+        """读取并缩放图片, 不涉及Tk对象, 可在后台线程调用"""
+        try:
+            # 使用PIL打开图片
+            image = Image.open(image_path)
+            
+            # 如果是调色板模式，转换为RGB
+            if image.mode in ('P', 'PA'):
+                image = image.convert('RGBA')
+            
+            # 获取原始尺寸
+            orig_width, orig_height = image.size
+            
+            # 计算缩放比例，保持原始比例
+            scale = min(max_size[0]/orig_width, max_size[1]/orig_height, 1.0)
+            
+            if scale != 1.0:
+                new_width = int(orig_width * scale)
+                new_height = int(orig_height * scale)
+                
+                # 确保图像在缩放前是RGB模式
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                
+                # 使用高质量缩放
+                image = image.resize((new_width, new_height), Image.LANCZOS)
+            
+            image.load()
+            return image
+        except Exception as e:
+            self.logger.error(f"Failed to create image preview: {str(e)}")
+            return None
+
 class PGSASSColorGUI:
+    THUMBNAIL_SIZE = (200, 150)
+    TILE_SIZE = (204, 175)
+    # 预加载当前行之后几个待确认行的图片
+    PREFETCH_AHEAD = 3
+
     def __init__(self):
         self.root = ThemedTk(theme="equilux")
         self.root.title("PGS/ASS 字幕颜色处理工具")
@@ -352,6 +1071,7 @@ class PGSASSColorGUI:
         self.images_dir = tk.StringVar()
         self.output_path = tk.StringVar()
         self.save_json = tk.StringVar()
+        self.extract_method = tk.StringVar(value="kmeans")
         self.current_updater = None
         
         # 创建界面
@@ -364,10 +1084,20 @@ class PGSASSColorGUI:
         self.processing = False
         self.current_images = []
         self.current_color_info = None
+        self.current_review = None
+        self.review_output = None
+        # 缩放后的候选图片缓存; 预览控件重复使用, 只为可见的图片创建PhotoImage
+        self.thumbnails = ThumbnailCache()
+        self.placeholder = tk.PhotoImage(width=1, height=1)
+        self.color_slots = []
+        self.tile_columns = 1
+        self._render_pending = False
 
         # 配置窗口大小调整行为
         self.root.grid_rowconfigure(0, weight=1)
         self.root.grid_columnconfigure(0, weight=1)
+
+        self.root.after(100, self.check_queue)
         
     def setup_logging(self):
         """设置日志系统"""
@@ -407,7 +1137,7 @@ class PGSASSColorGUI:
         file_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
         
         # XML文件选择
-        ttk.Label(file_frame, text="XML文件:").grid(row=0, column=0, sticky="w")
+        ttk.Label(file_frame, text="XML/SUP文件:").grid(row=0, column=0, sticky="w")
         ttk.Entry(file_frame, textvariable=self.xml_path).grid(row=0, column=1, sticky="ew", padx=5)
         ttk.Button(file_frame, text="浏览", command=lambda: self.browse_file("xml")).grid(row=0, column=2)
         
@@ -426,6 +1156,11 @@ class PGSASSColorGUI:
         ttk.Entry(file_frame, textvariable=self.output_path).grid(row=3, column=1, sticky="ew", padx=5)
         ttk.Button(file_frame, text="浏览", command=lambda: self.browse_file("output")).grid(row=3, column=2)
         
+        # 颜色提取方法
+        ttk.Label(file_frame, text="提取方法:").grid(row=4, column=0, sticky="w")
+        ttk.Combobox(file_frame, textvariable=self.extract_method, values=PGSColorAnalyzer.METHODS,
+                     state="readonly").grid(row=4, column=1, sticky="ew", padx=5)
+        
         file_frame.grid_columnconfigure(1, weight=1)
         
         # 控制区域
@@ -457,9 +1192,29 @@ class PGSASSColorGUI:
 
     def create_right_panel(self, parent):
         """创建右侧面板"""
+        # 待确认列表: 自动处理完成后列出所有歧义行, 可按任意顺序处理
+        review_frame = ttk.LabelFrame(parent, text="待确认行", padding=5)
+        review_frame.grid(row=0, column=0, sticky="nsew", pady=(0, 5))
+
+        self.review_tree = ttk.Treeview(review_frame, columns=("time", "text", "status"),
+                                        show="headings", height=8, selectmode="browse")
+        self.review_tree.heading("time", text="时间")
+        self.review_tree.heading("text", text="文本")
+        self.review_tree.heading("status", text="状态")
+        self.review_tree.column("time", width=150, stretch=False)
+        self.review_tree.column("status", width=80, stretch=False)
+        review_scrollbar = ttk.Scrollbar(review_frame, orient="vertical", command=self.review_tree.yview)
+        self.review_tree.configure(yscrollcommand=review_scrollbar.set)
+        self.review_tree.grid(row=0, column=0, sticky="nsew")
+        review_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.review_tree.bind("<<TreeviewSelect>>", self.on_review_select)
+
+        review_frame.grid_rowconfigure(0, weight=1)
+        review_frame.grid_columnconfigure(0, weight=1)
+
         # 预览区域
         preview_frame = ttk.LabelFrame(parent, text="颜色选择预览", padding=5)
-        preview_frame.grid(row=0, column=0, sticky="nsew")
+        preview_frame.grid(row=1, column=0, sticky="nsew")
         
         # ASS行内容显示
         ass_frame = ttk.LabelFrame(preview_frame, text="字幕行内容", padding=5)
@@ -487,7 +1242,8 @@ class PGSASSColorGUI:
         self.colors_canvas = tk.Canvas(colors_frame, bg='#2d2d2d')
         colors_scrollbar = ttk.Scrollbar(colors_frame, orient="vertical", 
                                        command=self.colors_canvas.yview)
-        self.colors_canvas.configure(yscrollcommand=colors_scrollbar.set)
+        self.colors_canvas.configure(yscrollcommand=lambda first, last: (
+            colors_scrollbar.set(first, last), self.schedule_render_thumbnails()))
         
         self.colors_frame_inner = ttk.Frame(self.colors_canvas)
         self.colors_canvas.create_window((0, 0), window=self.colors_frame_inner, anchor='nw')
@@ -501,141 +1257,217 @@ class PGSASSColorGUI:
         colors_frame.grid_rowconfigure(0, weight=1)
         colors_frame.grid_columnconfigure(0, weight=1)
         parent.grid_rowconfigure(0, weight=1)
+        parent.grid_rowconfigure(1, weight=3)
         parent.grid_columnconfigure(0, weight=1)
 
         # 绑定调整大小事件
         self.colors_frame_inner.bind('<Configure>', 
                                    lambda e: self.colors_canvas.configure(
                                        scrollregion=self.colors_canvas.bbox("all")))
+        self.colors_canvas.bind('<Configure>', self.on_colors_canvas_resize)
 
-    def update_preview_gui(self, data):
+    def populate_review_list(self):
+        """自动处理完成后填充待确认列表"""
+        self.review_tree.delete(*self.review_tree.get_children())
+        updater = self.current_updater
+        if not updater or not updater.review_items:
+            return
+        for i, item in enumerate(updater.review_items):
+            event = updater.review_events[i]
+            self.review_tree.insert("", tk.END, iid=str(i),
+                                    values=(f"{event.start} -> {event.end}", item['text'], "待定"))
+        self.select_review(0)
+
+    def prefetch_reviews(self, index):
+        """后台预加载当前行及之后几个待确认行的候选图片"""
+        updater = self.current_updater
+        upcoming = [i for i in updater.pending_reviews() if i > index][:self.PREFETCH_AHEAD]
+        paths = [
+            img_path
+            for i in [index] + upcoming
+            for info in updater.review_items[i]['candidates'].values()
+            for img_path in info['images']
+        ]
+        self.thumbnails.prefetch(paths, self.THUMBNAIL_SIZE)
+
+    def select_review(self, index):
+        """在列表中选中并预览第index行"""
+        iid = str(index)
+        self.review_tree.selection_set(iid)
+        self.review_tree.see(iid)
+
+    def on_review_select(self, _event=None):
+        selection = self.review_tree.selection()
+        if selection and self.current_updater:
+            self.current_review = int(selection[0])
+            self.update_preview_gui(self.current_review)
+            self.prefetch_reviews(self.current_review)
+
+    def resolve_current_review(self, color):
+        """处理当前选中的行, 保存进度, 并跳到下一个未处理的行"""
+        updater = self.current_updater
+        if not updater or self.current_review is None:
+            return
+        index = self.current_review
+        updater.resolve_review(index, color)
+        self.review_tree.set(str(index), "status", color or "跳过")
+        if color is None:
+            self.log_text.insert(tk.END, f"跳过行: {updater.review_items[index]['text']}\n")
+            self.log_text.see(tk.END)
+        self.save_review_progress()
+
+        pending = updater.pending_reviews()
+        if pending:
+            later = [i for i in pending if i > index]
+            self.select_review(later[0] if later else pending[0])
+        else:
+            self.queue.put(("info", "所有待确认行已处理完成！"))
+
+    def save_review_progress(self):
+        """保存已完成的工作: 更新后的ASS和剩余的待确认行"""
+        try:
+            self.current_updater.save(self.review_output)
+            self.current_updater.save_review(str(Path(self.review_output).with_suffix('.review.json')))
+        except Exception as e:
+            self.logger.error(f"Failed to save progress: {str(e)}")
+
+    def update_preview_gui(self, index):
         """更新预览界面"""
-        event, color_info = data
-        
-        # 清除之前的内容
-        for widget in self.colors_frame_inner.winfo_children():
-            widget.destroy()
+        item = self.current_updater.review_items[index]
+        event = self.current_updater.review_events[index]
+        color_info = item['candidates']
         
         # 显示ASS行内容
         self.ass_text.delete(1.0, tk.END)
         self.ass_text.insert(tk.END, f"时间: {event.start} -> {event.end}\n")
-        self.ass_text.insert(tk.END, f"样式: {event.style}\n")
-        self.ass_text.insert(tk.END, f"文本: {event.text}")
-        
-        # 为每个颜色创建预览区域
-        for i, (color, info) in enumerate(sorted(color_info.items(), 
-                                            key=lambda x: x[1]['percentage'],
-                                            reverse=True)):
-            color_frame = ttk.LabelFrame(self.colors_frame_inner, 
-                                    text=f"颜色选项 {i+1}", padding=5)
-            color_frame.pack(fill=tk.X, padx=5, pady=5)
-            
-            # 颜色信息和按钮区域
-            info_frame = ttk.Frame(color_frame)
-            info_frame.pack(fill=tk.X, padx=5, pady=5)
-            
-            # 显示颜色样本
-            color_sample = tk.Canvas(info_frame, width=50, height=20, bg=color)
-            color_sample.pack(side=tk.LEFT, padx=5)
-            
-            # 显示颜色代码和使用时长百分比
-            ttk.Label(info_frame, 
-                    text=f"颜色代码: {color} | 使用时长: {info['percentage']:.1%}"
-                    ).pack(side=tk.LEFT, padx=5)
-            
-            # 选择按钮
-            ttk.Button(info_frame, 
-                    text="使用此颜色", 
-                    command=lambda c=color: self.confirm_color_selection(c)
-                    ).pack(side=tk.RIGHT, padx=5)
-            
-            # 创建图片预览区域
-            images_frame = ttk.Frame(color_frame)
-            images_frame.pack(fill=tk.X, padx=5, pady=5)
-            
-            # 使用Flowbox布局显示图片
-            current_row = ttk.Frame(images_frame)
-            current_row.pack(fill=tk.X)
-            row_width = 0
-            max_width = self.colors_frame_inner.winfo_width() - 20  # 留出一些边距
-            
-            for img_path in info['images']:
-                # 创建预览
-                photo = self.create_image_preview(img_path, (200, 150))  # 控制最大尺寸
-                if photo:
-                    if row_width + photo.width() > max_width and row_width > 0:
-                        # 创建新行
-                        current_row = ttk.Frame(images_frame)
-                        current_row.pack(fill=tk.X)
-                        row_width = 0
-                    
-                    # 创建图片容器
-                    img_container = ttk.Frame(current_row)
-                    img_container.pack(side=tk.LEFT, padx=2, pady=2)
-                    
-                    # 显示图片
-                    label = ttk.Label(img_container, image=photo)
-                    label.image = photo
-                    label.pack()
-                    
-                    # 显示文件名
-                    ttk.Label(img_container, 
-                            text=os.path.basename(img_path),
-                            wraplength=photo.width()  # 文件名宽度匹配图片宽度
-                            ).pack()
-                    
-                    row_width += photo.width() + 4  # 加上padding
+        self.ass_text.insert(tk.END, f"样式: {item['style']}\n")
+        self.ass_text.insert(tk.END, f"文本: {item['text']}")
+        
+        # 为每个颜色填充预览区域, 重复使用之前创建的控件
+        candidates = sorted(color_info.items(), key=lambda x: x[1]['percentage'], reverse=True)
+        while len(self.color_slots) < len(candidates):
+            self.color_slots.append(self.create_color_slot())
+        for slot in self.color_slots:
+            slot['frame'].pack_forget()
+        for i, (color, info) in enumerate(candidates):
+            self.fill_color_slot(self.color_slots[i], i, color, info)
         
-        # 更新主画布滚动区域
+        # 更新主画布滚动区域, 回到顶部后只渲染可见的图片
         self.colors_frame_inner.update_idletasks()
         self.colors_canvas.configure(scrollregion=self.colors_canvas.bbox("all"))
+        self.colors_canvas.yview_moveto(0)
+        self.schedule_render_thumbnails()
 
-    def create_image_preview(self, image_path, max_size=(200, 150)):
-        """创建自适应大小的图片预览"""
-        try:
-            # 使用PIL打开图片
-            image = Image.open(image_path)
-            
-            # 如果是调色板模式，转换为RGB
-            if image.mode in ('P', 'PA'):
-                image = image.convert('RGBA')
-            
-            # 获取原始尺寸
-            orig_width, orig_height = image.size
-            
-            # 计算缩放比例，保持原始比例
-            scale = min(max_size[0]/orig_width, max_size[1]/orig_height, 1.0)
-            
-            if scale != 1.0:
-                new_width = int(orig_width * scale)
-                new_height = int(orig_height * scale)
-                
-                # 确保图像在缩放前是RGB模式
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                # 使用高质量缩放
-                image = image.resize((new_width, new_height), Image.LANCZOS)
-            
-            return ImageTk.PhotoImage(image)
-        except Exception as e:
-            self.logger.error(f"Failed to create image preview: {str(e)}")
-            return None
+    def create_color_slot(self):
+        """创建一个颜色选项的控件组"""
+        frame = ttk.LabelFrame(self.colors_frame_inner, padding=5)
+        
+        # 颜色信息和按钮区域
+        info_frame = ttk.Frame(frame)
+        info_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        # 颜色样本, 颜色代码和使用时长百分比, 选择按钮
+        sample = tk.Canvas(info_frame, width=50, height=20)
+        sample.pack(side=tk.LEFT, padx=5)
+        label = ttk.Label(info_frame)
+        label.pack(side=tk.LEFT, padx=5)
+        button = ttk.Button(info_frame, text="使用此颜色")
+        button.pack(side=tk.RIGHT, padx=5)
+        
+        # 图片预览区域
+        images_frame = ttk.Frame(frame)
+        images_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        return {'frame': frame, 'sample': sample, 'label': label, 'button': button,
+                'images_frame': images_frame, 'tiles': [], 'count': 0}
+
+    def create_tile(self, parent):
+        """创建固定大小的图片容器, 图片在滚动到可见区域时才加载"""
+        frame = ttk.Frame(parent, width=self.TILE_SIZE[0], height=self.TILE_SIZE[1])
+        frame.pack_propagate(False)
+        image_label = ttk.Label(frame, image=self.placeholder)
+        image_label.pack()
+        name_label = ttk.Label(frame, wraplength=self.THUMBNAIL_SIZE[0])
+        name_label.pack()
+        return {'frame': frame, 'image': image_label, 'name': name_label, 'path': None, 'rendered': False}
+
+    def fill_color_slot(self, slot, index, color, info):
+        slot['frame'].configure(text=f"颜色选项 {index+1}")
+        slot['frame'].pack(fill=tk.X, padx=5, pady=5)
+        slot['sample'].configure(bg=color)
+        slot['label'].configure(text=f"颜色代码: {color} | 使用时长: {info['percentage']:.1%}"
+                                     + ("" if info['images'] else " | 无预览图片"))
+        slot['button'].configure(command=lambda c=color: self.confirm_color_selection(c))
+        
+        tiles = slot['tiles']
+        images = info['images']
+        while len(tiles) < len(images):
+            tiles.append(self.create_tile(slot['images_frame']))
+        for tile, img_path in zip(tiles, images):
+            if tile['path'] != img_path:
+                tile['path'] = img_path
+                tile['rendered'] = False
+                tile['image'].configure(image=self.placeholder)
+                tile['image'].image = None
+                tile['name'].configure(text=os.path.basename(img_path))
+        for tile in tiles[len(images):]:
+            tile['frame'].grid_remove()
+        slot['count'] = len(images)
+        self.grid_tiles(slot)
+
+    def grid_tiles(self, slot):
+        """按画布宽度把图片容器排成网格"""
+        for k, tile in enumerate(slot['tiles'][:slot['count']]):
+            tile['frame'].grid(row=k // self.tile_columns, column=k % self.tile_columns, padx=2, pady=2)
+
+    def on_colors_canvas_resize(self, event):
+        columns = max(1, (event.width - 20) // (self.TILE_SIZE[0] + 4))
+        if columns != self.tile_columns:
+            self.tile_columns = columns
+            for slot in self.color_slots:
+                self.grid_tiles(slot)
+        self.schedule_render_thumbnails()
+
+    def schedule_render_thumbnails(self):
+        if not self._render_pending:
+            self._render_pending = True
+            self.root.after_idle(self.render_visible_thumbnails)
+
+    def render_visible_thumbnails(self):
+        """只为滚动区域中可见 (及附近) 的图片创建PhotoImage"""
+        self._render_pending = False
+        top = self.colors_canvas.canvasy(0)
+        bottom = top + self.colors_canvas.winfo_height()
+        margin = self.TILE_SIZE[1]
+        for slot in self.color_slots:
+            if not slot['frame'].winfo_ismapped():
+                continue
+            offset = slot['frame'].winfo_y() + slot['images_frame'].winfo_y()
+            for tile in slot['tiles'][:slot['count']]:
+                if tile['rendered']:
+                    continue
+                y = offset + tile['frame'].winfo_y()
+                if y + self.TILE_SIZE[1] < top - margin or y > bottom + margin:
+                    continue
+                image = self.thumbnails.get(tile['path'], self.THUMBNAIL_SIZE)
+                if image is not None:
+                    photo = ImageTk.PhotoImage(image)
+                    tile['image'].configure(image=photo)
+                    tile['image'].image = photo
+                tile['rendered'] = True
 
     def skip_current_line(self):
         """跳过当前行"""
-        if self.current_updater:
-            self.current_updater.skip_current_line()
+        self.resolve_current_review(None)
             
     def confirm_color_selection(self, color):
         """确认颜色选择"""
-        if self.current_updater:
-            self.current_updater.set_selected_color(color)
+        self.resolve_current_review(color)
             
     def browse_file(self, file_type):
         """浏览并选择文件"""
         filetypes = {
-            "xml": [("XML files", "*.xml")],
+            "xml": [("BDN XML / PGS files", "*.xml *.sup"), ("XML files", "*.xml"), ("PGS files", "*.sup")],
             "ass": [("ASS files", "*.ass")],
             "output": [("ASS files", "*.ass")]
         }
@@ -658,10 +1490,6 @@ class PGSASSColorGUI:
         if directory:
             self.images_dir.set(directory)
 
-    def update_preview(self, color_info):
-        """更新预览区域"""
-        self.queue.put(("preview", color_info))
-
     def show_image(self, image_path):
         """在画布上显示图片"""
         try:
@@ -696,18 +1524,21 @@ class PGSASSColorGUI:
         if self.processing:
             return
             
-        if not all([self.xml_path.get(), self.ass_path.get(), self.images_dir.get(), self.output_path.get()]):
+        is_sup = self.xml_path.get().lower().endswith('.sup')
+        if not all([self.xml_path.get(), self.ass_path.get(), is_sup or self.images_dir.get(), self.output_path.get()]):
             messagebox.showerror("错误", "请先选择所有必要的文件和目录")
             return
             
         self.processing = True
         self.progress['value'] = 0
+        self.current_updater = None
+        self.current_review = None
+        self.review_tree.delete(*self.review_tree.get_children())
+        for slot in self.color_slots:
+            slot['frame'].pack_forget()
         
         # 在新线程中处理文件
         threading.Thread(target=self.process_files, daemon=True).start()
-        
-        # 开始检查消息队列
-        self.root.after(100, self.check_queue)
 
     def stop_processing(self):
         """停止处理"""
@@ -716,37 +1547,44 @@ class PGSASSColorGUI:
     def process_files(self):
         """处理文件的主要逻辑"""
         try:
-            self.queue.put(("log", "开始分析XML文件和提取颜色..."))
-            analyzer = PGSColorAnalyzer(self.queue)
-            results = analyzer.parse_xml_and_analyze(self.xml_path.get(), self.images_dir.get())
+            analyzer = PGSColorAnalyzer(self.queue, self.extract_method.get())
+            images_dir = self.images_dir.get()
+            if self.xml_path.get().lower().endswith('.sup'):
+                self.queue.put(("log", "开始解析SUP文件和读取调色板..."))
+                results = analyzer.parse_sup_and_analyze(self.xml_path.get())
+                images_dir = images_dir or str(Path(self.xml_path.get()).parent)
+            else:
+                self.queue.put(("log", "开始分析XML文件和提取颜色..."))
+                results = analyzer.parse_xml_and_analyze(self.xml_path.get(), images_dir)
             
             if not results:
                 self.queue.put(("error", "颜色分析失败"))
                 return
                 
-            temp_json = "temp_colors.json"
-            analyzer.save_results(results, temp_json)
-            
             self.queue.put(("log", "开始更新ASS文件..."))
-            self.current_updater = ASSColorUpdater(
+            updater = ASSColorUpdater(
                 self.ass_path.get(), 
-                temp_json, 
-                self.images_dir.get(),
+                None, 
+                images_dir,
                 self.queue,
-                self.update_preview
+                colors=results,
+                ambiguous_policy="review"
             )
-            self.current_updater.update_dialogues_colors()
-            self.current_updater.save(self.output_path.get())
+            updater.update_dialogues_colors()
+            # 先保存自动处理的结果, 待确认行在界面中处理, 每处理一行保存一次
+            updater.save(self.output_path.get())
             
-            os.remove(temp_json)
-            self.queue.put(("info", "处理完成！"))
+            if updater.review_items:
+                self.queue.put(("review", (updater, self.output_path.get())))
+                self.queue.put(("log", f"{len(updater.review_items)} 行需要确认, 请在待确认列表中选择颜色"))
+            else:
+                self.queue.put(("info", "处理完成！"))
             
         except Exception as e:
             self.queue.put(("error", f"处理失败: {str(e)}"))
             
         finally:
             self.processing = False
-            self.current_updater = None
 
     def check_queue(self):
         """检查消息队列"""
@@ -763,16 +1601,109 @@ class PGSASSColorGUI:
                     messagebox.showerror("错误", message)
                 elif msg_type == "info":
                     messagebox.showinfo("信息", message)
-                elif msg_type == "preview":
-                    self.update_preview_gui(message)
+                elif msg_type == "review":
+                    self.current_updater, self.review_output = message
+                    self.populate_review_list()
                     
         except queue.Empty:
             pass
             
-        if self.processing:
-            self.root.after(100, self.check_queue)
+        self.root.after(100, self.check_queue)
+
+def find_season_jobs(season_dir: str) -> List[Tuple[str, str, str]]:
+    """
+    按目录约定查找 (PGS来源, ASS, 输出) 三元组: 同名的 .sup 或 .xml 与 .ass 为一集,
+    输出为 <名称>_colored.ass. .xml 的图片目录为其所在目录.
+    """
+    jobs = []
+    season_path = Path(season_dir)
+    for ass_path in sorted(season_path.glob("*.ass")):
+        if ass_path.stem.endswith("_colored"):
+            continue
+        for ext in (".sup", ".xml"):
+            source = ass_path.with_suffix(ext)
+            if source.exists():
+                output = ass_path.with_name(ass_path.stem + '_colored' + ass_path.suffix)
+                jobs.append((str(source), str(ass_path), str(output)))
+                break
+    return jobs
+
+def process_episode(source: str, ass_path: str, output_path: str, policy: str = "review",
+                    method: str = "kmeans", pool: Optional[ProcessPoolExecutor] = None,
+                    images_dir: Optional[str] = None) -> Dict:
+    """无界面处理一集: 分析PGS, 按策略处理歧义行, 保存ASS (review策略另存 .review.json)"""
+    logger = logging.getLogger(__name__)
+    analyzer = PGSColorAnalyzer(method=method)
+    images_dir = images_dir or str(Path(source).parent)
+    if source.lower().endswith('.sup'):
+        results = analyzer.parse_sup_and_analyze(source)
+    else:
+        results = analyzer.parse_xml_and_analyze(source, images_dir, pool=pool)
+    if not results:
+        raise RuntimeError(f"Color analysis failed for {source}")
+
+    updater = ASSColorUpdater(ass_path, None, images_dir, colors=results, ambiguous_policy=policy)
+    updated = updater.update_dialogues_colors()
+    updater.save(output_path)
+
+    review_path = None
+    if updater.review_items:
+        review_path = str(Path(output_path).with_suffix('.review.json'))
+        updater.save_review(review_path)
+    logger.info(f"{ass_path}: {updated} dialogues colored, {len(updater.review_items)} for review -> {output_path}")
+    return {'source': source, 'ass': ass_path, 'output': output_path, 'updated': updated,
+            'review': len(updater.review_items), 'review_path': review_path}
+
+def run_batch(jobs: List[Tuple[str, str, str]], policy: str = "review", method: str = "kmeans",
+              workers: Optional[int] = None, episodes: int = 2) -> List[Dict]:
+    """多集并行处理, 所有集共享一个图片分析进程池"""
+    logger = logging.getLogger(__name__)
+    summaries = []
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_analysis_worker) as pool:
+        with ThreadPoolExecutor(max_workers=episodes) as episode_pool:
+            futures = {
+                episode_pool.submit(process_episode, source, ass_path, output_path, policy, method, pool): ass_path
+                for source, ass_path, output_path in jobs
+            }
+            for future in as_completed(futures):
+                try:
+                    summaries.append(future.result())
+                except Exception as e:
+                    failed.append(futures[future])
+                    logger.error(f"{futures[future]}: {str(e)}")
+    logger.info(f"Batch finished: {len(summaries)} succeeded, {len(failed)} failed, "
+                f"{sum(s['review'] for s in summaries)} lines for review")
+    return summaries
 
 def main():
+    parser = argparse.ArgumentParser(description="PGS/ASS 字幕颜色处理工具")
+    parser.add_argument('--compare-extractors', metavar='IMAGES_DIR',
+                        help="Compare speed and agreement of the kmeans and histogram extractors on a PNG sample.")
+    parser.add_argument('--sample', type=int, default=200, help="Number of images sampled by --compare-extractors.")
+    parser.add_argument('--job', nargs=3, action='append', metavar=('PGS', 'ASS', 'OUTPUT'),
+                        help="Process one episode without the GUI (PGS is a BDN .xml or a .sup); may be repeated.")
+    parser.add_argument('--season-dir', help="Process every <name>.ass with a matching <name>.sup/.xml in this directory.")
+    parser.add_argument('--policy', choices=ASSColorUpdater.AMBIGUOUS_POLICIES,
+                        default="review", help="What to do with ambiguous lines in batch mode (default: review).")
+    parser.add_argument('--method', choices=PGSColorAnalyzer.METHODS, default="kmeans", help="Outline color extractor.")
+    parser.add_argument('--workers', type=int, help="Image analysis processes shared by all episodes.")
+    parser.add_argument('--episodes', type=int, default=2, help="Episodes processed at once in batch mode.")
+    args = parser.parse_args()
+
+    if args.compare_extractors:
+        compare_extractors(args.compare_extractors, args.sample)
+        return
+
+    if args.job or args.season_dir:
+        jobs = [tuple(job) for job in args.job or []]
+        if args.season_dir:
+            jobs += find_season_jobs(args.season_dir)
+        if not jobs:
+            parser.error("no episodes found")
+        summaries = run_batch(jobs, args.policy, args.method, args.workers, args.episodes)
+        sys.exit(0 if len(summaries) == len(jobs) else 1)
+
     app = PGSASSColorGUI()
     app.root.mainloop()
 